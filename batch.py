@@ -0,0 +1,155 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict
+
+from cache import RouteCache
+from io_handler import route_format, strip_compression_extension, EXTENSIONS
+from segment import GEOMETRY_BACKENDS
+from simplify import simplify_route
+
+
+def find_inputs(source: str) -> List[Tuple[str, str]]:
+    """Find route files of a source. A source is a directory, a glob pattern or a manifest file (.txt) with one input
+    path per line, optionally followed by a tab and an output path. Returns pairs of input and output paths, output
+    paths are empty if they are not defined by the manifest."""
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(directory, name) for directory, _, names in os.walk(source) for name in names)
+        return [(path, "") for path in paths if is_route_file(path)]
+
+    if source.lower().endswith(".txt") and os.path.isfile(source):
+        # Relative paths of a manifest are relative to the manifest.
+        base = os.path.dirname(source)
+        inputs = []
+        with open(source) as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                paths = line.rstrip("\n").split("\t")
+                inputs.append((os.path.join(base, paths[0]), os.path.join(base, paths[1]) if len(paths) > 1 else ""))
+        return inputs
+
+    return [(path, "") for path in sorted(glob.glob(source, recursive=True)) if is_route_file(path)]
+
+
+def is_route_file(path: str) -> bool:
+    # Results written next to the inputs are not inputs.
+    if ".simplified." in os.path.basename(path):
+        return False
+    try:
+        route_format(path, compressed=True)
+        return True
+    except Exception:
+        return False
+
+
+def output_path_for(input_path: str, base: str, output_dir: str, output_extension: str) -> str:
+    # Outputs are written under output_dir mirroring the input tree, or next to the inputs.
+    stem = strip_compression_extension(input_path)
+    stem = stem[:-len(os.path.splitext(stem)[1])]
+    if output_dir:
+        return os.path.join(output_dir, os.path.relpath(stem, base) + output_extension)
+    return stem + ".simplified" + output_extension
+
+
+def output_paths(inputs: List[Tuple[str, str]], output_dir: str, output_extension: str) -> List[str]:
+    """Output paths of pairs of input and output paths found by find_inputs. Raises ValueError if inputs would be
+    written to the same output, e.g. routes with the same name and different extensions."""
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path, _ in inputs]) if inputs else ""
+    paths = [path_to or output_path_for(os.path.abspath(path_from), base, output_dir, output_extension)
+             for path_from, path_to in inputs]
+
+    sources: Dict[str, List[str]] = dict()
+    for (path_from, _), path_to in zip(inputs, paths):
+        sources.setdefault(os.path.abspath(path_to), []).append(path_from)
+    collisions = [f"{', '.join(paths_from)} -> {path_to}" for path_to, paths_from in sources.items()
+                  if len(paths_from) > 1]
+    if collisions:
+        raise ValueError(f"Routes would be written to the same output: {'; '.join(collisions)}")
+    return paths
+
+
+def simplify_task(task: Tuple[str, str, str, str, int]) -> Dict:
+    # Errors are reported in the result, so one malformed route does not abort the batch.
+    path_from, path_to, geometry, cache_path, cache_size = task
+    start = time.perf_counter()
+    result = {"input": path_from, "output": path_to, "bytes": 0, "parts": 0, "cached": False, "error": None}
+    try:
+        result["bytes"] = os.path.getsize(path_from)
+        if os.path.dirname(path_to):
+            os.makedirs(os.path.dirname(path_to), exist_ok=True)
+        if cache_path:
+            with RouteCache(cache_path, cache_size) as cache:
+                route = simplify_route(path_from, path_to, geometry, log=lambda message: None, cache=cache)
+                result["cached"] = cache.hits["routes"] > 0
+        else:
+            route = simplify_route(path_from, path_to, geometry, log=lambda message: None)
+        result["parts"] = len(route.parts)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def simplify_batch(sources: List[str], output_dir: str = "", output_extension: str = ".json", workers: int = None,
+                   chunk_size: int = 1, geometry: str = "numpy", cache_path: str = "",
+                   cache_size: int = 2 ** 30) -> Dict:
+    """Simplify all routes of the sources in a process pool. Returns a summary with results of every route.
+    Workers share the cache if its path is given."""
+    route_format(output_extension)
+
+    inputs = [paths for source in sources for paths in find_inputs(source)]
+    tasks = [(path_from, path_to, geometry, cache_path, cache_size)
+             for (path_from, _), path_to in zip(inputs, output_paths(inputs, output_dir, output_extension))]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(simplify_task, tasks, chunksize=chunk_size))
+    seconds = time.perf_counter() - start
+
+    failed = [result for result in results if result["error"]]
+    return {
+        "routes": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "cached": sum(1 for result in results if result["cached"]),
+        "seconds": seconds,
+        "routes_per_second": len(results) / seconds if seconds else 0.0,
+        "megabytes_per_second": sum(result["bytes"] for result in results) / 2 ** 20 / seconds if seconds else 0.0,
+        "results": results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simplify many routes with a process pool.')
+    parser.add_argument('sources', type=str, nargs='+',
+                        help='Directories, glob patterns or manifest files (.txt) with input paths.')
+    parser.add_argument('--output-dir', type=str, default="",
+                        help='Directory for the results. Results are written next to the inputs by default.')
+    parser.add_argument('--format', choices=list(EXTENSIONS), default=".json", help='Extension of the results.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes. All CPUs by default.')
+    parser.add_argument('--chunk-size', type=int, default=1, help='Number of routes sent to a worker at once.')
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="numpy",
+                        help='Geometry backend for shortening and offsetting segments.')
+    parser.add_argument('--cache', type=str, default="", help='Path to a SQLite cache shared by the workers.')
+    parser.add_argument('--cache-size', type=float, default=1024, help='Maximum size of the cache in megabytes.')
+    parser.add_argument('--summary', type=str, default="", help='Path to save the summary as JSON.')
+
+    args = parser.parse_args()
+
+    summary = simplify_batch(args.sources, args.output_dir, args.format, args.workers, args.chunk_size, args.geometry,
+                             args.cache, int(args.cache_size * 2 ** 20))
+
+    for result in summary["results"]:
+        status = result["error"] or f"saved as {result['output']}"
+        print(f"{result['input']}: {result['seconds']:.3f} s, {status}")
+    print(f"{summary['succeeded']} of {summary['routes']} routes simplified in {summary['seconds']:.1f} s "
+          f"({summary['routes_per_second']:.1f} routes/s, {summary['megabytes_per_second']:.2f} MB/s), "
+          f"{summary['failed']} failed, {summary['cached']} from the cache")
+
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,94 @@
+"""Round-trip check and benchmark of the binary route format (.rsb) against JSON.
+
+Run from the repository root:
+    python3 -m benchmarks.binary --sizes 1000 100000 1000000
+Exits with a non-zero status if a route read back from .rsb differs from the same route read from JSON, or if the
+pair ids column does not match the saved route.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generator import generate_route, SCENARIOS
+from io_handler import read_route_json, read_route_binary, read_route_binary_pair_ids, save_points_binary, \
+    save_route_json, save_route_binary
+from points import Points
+from route import Route
+from segment import Segment
+from simplify import simplify
+
+
+def same_points(points: Points, expected: Points) -> bool:
+    return all(np.array_equal(getattr(points, column), getattr(expected, column))
+               for column in ("lat", "lon", "north", "east")) and points.zone == expected.zone
+
+
+def route_pair_ids(route: Route) -> np.ndarray:
+    # Pair id of every node, -1 for nodes of connections.
+    return np.array([route_part.pair.id if isinstance(route_part, Segment) else -1
+                     for route_part in route.parts for _ in route_part.nodes], dtype=np.int64)
+
+
+def check_empty(directory: str) -> bool:
+    # An empty route reads back empty from both formats.
+    json_path, binary_path = os.path.join(directory, "empty.json"), os.path.join(directory, "empty.rsb")
+    save_points_binary(Points(np.empty(0), np.empty(0)), binary_path)
+    points_same = len(read_route_binary(binary_path)) == 0
+
+    save_route_json(Route([]), json_path)
+    save_route_binary(Route([]), binary_path, pair_ids=True)
+    route_same = len(read_route_json(json_path)) == 0 and len(read_route_binary(binary_path)) == 0 \
+        and len(read_route_binary_pair_ids(binary_path)) == 0
+    return points_same and route_same
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check round trips of the binary route format.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Route sizes in points.')
+    parser.add_argument('--scenario', choices=SCENARIOS, default="intersections", help='Scenario of generated routes.')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        same = check_empty(directory)
+        failed = failed or not same
+        print(f"Empty route same: {same}")
+
+        print(f"{'points':>10} {'json read s':>12} {'rsb read s':>11} {'input same':>11} {'output same':>12} "
+              f"{'pair ids same':>14}")
+        for size in args.sizes:
+            json_path, binary_path = os.path.join(directory, "route.json"), os.path.join(directory, "route.rsb")
+            points = generate_route(size, scenario=args.scenario)
+            with open(json_path, "w") as f:
+                json.dump([{"lat": lat, "lon": lon} for lat, lon in zip(points.lat.tolist(), points.lon.tolist())], f)
+
+            # Input read from JSON, saved as .rsb and read back.
+            start = time.perf_counter()
+            expected = read_route_json(json_path)
+            json_seconds = time.perf_counter() - start
+            save_points_binary(expected, binary_path)
+            start = time.perf_counter()
+            input_same = same_points(read_route_binary(binary_path), expected)
+            binary_seconds = time.perf_counter() - start
+
+            # A simplified route saved as .json and as .rsb with pair ids reads back the same.
+            route = simplify(expected)
+            save_route_json(route, json_path)
+            save_route_binary(route, binary_path, pair_ids=True)
+            output_same = same_points(read_route_binary(binary_path), read_route_json(json_path))
+            pair_ids_same = np.array_equal(read_route_binary_pair_ids(binary_path), route_pair_ids(route))
+
+            failed = failed or not (input_same and output_same and pair_ids_same)
+            print(f"{size:>10} {json_seconds:>12.3f} {binary_seconds:>11.3f} {str(input_same):>11} "
+                  f"{str(output_same):>12} {str(pair_ids_same):>14}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
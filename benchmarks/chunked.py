@@ -0,0 +1,81 @@
+"""Parity check and peak memory benchmark of chunked simplification against simplify_route.
+
+Every measurement runs in a fresh process. Run from the repository root:
+    python3 -m benchmarks.chunked --sizes 100000 400000 1600000 --chunk-size 20000 --max-lanes 10000
+Exits with a non-zero status if chunked and whole results differ, or if peak memory of chunked simplification grows
+with the route length more than --max-growth times. Routes longer than --max-whole points are simplified only in
+chunks, the whole pipeline would need gigabytes for them.
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+from typing import Tuple
+
+from benchmarks.generator import generate_route, SCENARIOS
+from benchmarks.memory import reset_peak_rss, rss_kb
+from chunked import simplify_chunked
+from io_handler import save_points_binary
+from simplify import simplify_route
+
+
+def measure(mode: str, path_from: str, path_to: str, chunk_size: int, max_lanes: int) -> Tuple[int, float]:
+    reset_peak_rss()
+    before = rss_kb("VmRSS")
+    start = time.perf_counter()
+    if mode == "chunked":
+        simplify_chunked(path_from, path_to, chunk_size=chunk_size, max_lanes=max_lanes, log=lambda message: None)
+    else:
+        simplify_route(path_from, path_to, log=lambda message: None)
+    return rss_kb("VmHWM") - before, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare chunked and whole route simplification.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 400000, 1600000],
+                        help='Route sizes in points.')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='Points of a chunk.')
+    parser.add_argument('--max-lanes', type=int, default=10000,
+                        help='Lanes kept in memory. Small enough for lanes of the smallest route to be evicted.')
+    parser.add_argument('--scenario', choices=SCENARIOS, default="laps",
+                        help='Scenario of generated routes. Laps keep the number of distinct pairs fixed.')
+    parser.add_argument('--max-whole', type=int, default=400000,
+                        help='Longest route also simplified whole to check parity.')
+    parser.add_argument('--max-growth', type=float, default=1.5,
+                        help='Allowed ratio of chunked peak memory of the largest and the smallest route.')
+    args = parser.parse_args()
+
+    context = get_context("spawn")
+    failed = False
+    peaks = []
+    print(f"{'points':>10} {'mode':>8} {'peak MB':>10} {'seconds':>10} {'same':>6}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sorted(args.sizes):
+            path_from = os.path.join(directory, f"route{size}.rsb")
+            save_points_binary(generate_route(size, scenario=args.scenario), path_from)
+
+            results = {}
+            for mode in ("whole", "chunked") if size <= args.max_whole else ("chunked",):
+                results[mode] = os.path.join(directory, f"{mode}{size}.json")
+                with context.Pool(1) as pool:
+                    peak, seconds = pool.apply(measure, (mode, path_from, results[mode], args.chunk_size,
+                                                         args.max_lanes))
+                same = filecmp.cmp(results["whole"], results[mode], shallow=False) if "whole" in results else None
+                failed = failed or same is False
+                same = "-" if same is None else str(same)
+                print(f"{size:>10} {mode:>8} {peak / 1024:>10.1f} {seconds:>10.3f} {same:>6}")
+            peaks.append(peak)
+            for path in (path_from, *results.values()):
+                os.remove(path)
+
+    growth = peaks[-1] / max(peaks[0], 1)
+    print(f"Chunked peak memory grew {growth:.2f} times from {min(args.sizes)} to {max(args.sizes)} points")
+    failed = failed or growth > args.max_growth
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
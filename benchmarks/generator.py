@@ -0,0 +1,80 @@
+"""Deterministic synthetic routes for benchmarks.
+
+Scenarios:
+    intersections  random walk over a 10x10 grid of 100 meter blocks, many distinct pairs and dense intersections
+    laps           the same 8 block loop driven again and again, few distinct pairs with high frequencies
+    jitter         the random walk with GPS jitter close to NODES_POSITION_ERROR, so snapping is ambiguous
+    zone_crossing  laps around a loop crossing the boundary of UTM zones 32 and 33
+"""
+import math
+import random
+from typing import List, Tuple
+
+from config import NODES_POSITION_ERROR
+from points import Points
+
+SCENARIOS = ("intersections", "laps", "jitter", "zone_crossing")
+METERS_PER_DEGREE = 111_320
+BLOCK_POINTS = 4  # Points per 100 meter block, a point every 25 meters
+STEP = 25  # meters
+
+# Loop of 8 blocks as (north, east) moves.
+LAP = [(1, 0), (1, 0), (0, 1), (0, 1), (-1, 0), (-1, 0), (0, -1), (0, -1)]
+
+
+def generate_route(size: int, seed: int = 0, scenario: str = "intersections") -> Points:
+    rng = random.Random(seed)
+
+    if scenario == "intersections":
+        moves = random_walk(rng)
+        origin, jitter = (52.52, 13.40), 0.2
+    elif scenario == "laps":
+        moves = laps()
+        origin, jitter = (52.52, 13.40), 0.2
+    elif scenario == "jitter":
+        moves = random_walk(rng)
+        origin, jitter = (52.52, 13.40), 0.5 * NODES_POSITION_ERROR
+    elif scenario == "zone_crossing":
+        moves = laps()
+        origin, jitter = (52.52, 12.0 - 100 / (METERS_PER_DEGREE * math.cos(math.radians(52.52)))), 0.2
+    else:
+        raise Exception(f"Unknown scenario {scenario}. Available scenarios: {', '.join(SCENARIOS)}")
+
+    lats, lons = walk(size, rng, moves, origin, jitter)
+    return Points(lats, lons)
+
+
+def random_walk(rng: random.Random):
+    # Moves to neighbor grid intersections, staying within the grid.
+    north, east = 0, 0
+    while True:
+        d_north, d_east = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])
+        if 0 <= north + d_north <= 10 and 0 <= east + d_east <= 10:
+            north += d_north
+            east += d_east
+            yield d_north, d_east
+
+
+def laps():
+    while True:
+        yield from LAP
+
+
+def walk(size: int, rng: random.Random, moves, origin: Tuple[float, float],
+         jitter: float) -> Tuple[List[float], List[float]]:
+    # Jitter is uniform in meters along both axes.
+    lat_step = STEP / METERS_PER_DEGREE
+    lon_step = STEP / (METERS_PER_DEGREE * math.cos(math.radians(origin[0])))
+
+    lats, lons = [], []
+    north, east = 0, 0
+    for d_north, d_east in moves:
+        if len(lats) >= size:
+            break
+        for _ in range(BLOCK_POINTS):
+            lats.append(origin[0] + north * lat_step + rng.uniform(-jitter, jitter) * lat_step / STEP)
+            lons.append(origin[1] + east * lon_step + rng.uniform(-jitter, jitter) * lon_step / STEP)
+            north += d_north
+            east += d_east
+
+    return lats[:size], lons[:size]
@@ -0,0 +1,57 @@
+"""Parity check and benchmark of the NumPy geometry engine against the Shapely reference backend.
+
+Run from the repository root:
+    python3 -m benchmarks.geometry --sizes 1000 10000 100000
+Exits with a non-zero status if lanes of the two backends differ by more than the tolerance.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.generator import generate_route
+from node_pair import create_node_pairs
+from segment import create_segments
+
+TOLERANCE = 1e-6  # meters
+
+
+def lane_coordinates(segments) -> np.ndarray:
+    return np.array([[node.utm.north, node.utm.east] for lanes in segments for lane in lanes
+                     for node in lane.segment.nodes])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare NumPy and Shapely geometry backends.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Route sizes in points.')
+    parser.add_argument('--seeds', type=int, default=3, help='Number of random routes of every size.')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'points':>10} {'seed':>6} {'lanes':>8} {'numpy s':>10} {'shapely s':>10} {'max diff m':>12}")
+    for size in args.sizes:
+        for seed in range(args.seeds):
+            route = generate_route(size, seed)
+
+            timings = dict()
+            coordinates = dict()
+            for backend in ("numpy", "shapely"):
+                graph = create_node_pairs(route)
+                start = time.perf_counter()
+                segments = create_segments(graph, backend)
+                timings[backend] = time.perf_counter() - start
+                coordinates[backend] = lane_coordinates(segments)
+
+            difference = float(np.abs(coordinates["numpy"] - coordinates["shapely"]).max(initial=0))
+            failed = failed or difference > TOLERANCE
+            print(f"{size:>10} {seed:>6} {sum(graph.frequencies):>8} {timings['numpy']:>10.3f} "
+                  f"{timings['shapely']:>10.3f} {difference:>12.2e}")
+
+    if failed:
+        print(f"Backends differ by more than {TOLERANCE} m")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
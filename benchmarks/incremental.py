@@ -0,0 +1,62 @@
+"""Parity check and benchmark of IncrementalSimplifier against simplify of the whole route.
+
+Run from the repository root:
+    python3 -m benchmarks.incremental --size 1000 --shapely-size 100 --steps 1 7 50
+Generator routes are appended in steps of points. Exits with a non-zero status if the simplified route, or the route
+built by applying the returned RouteDiffs, differs from simplify of all points.
+"""
+import argparse
+import sys
+import time
+from typing import List, Tuple
+
+from benchmarks.generator import generate_route, SCENARIOS
+from incremental import IncrementalSimplifier
+from points import Points
+from route import Route
+from simplify import simplify
+
+
+def route_values(route: Route) -> List[Tuple[str, List[Tuple[float, float]]]]:
+    return [(type(route_part).__name__, [(node.latlon.lat, node.latlon.lon) for node in route_part.nodes])
+            for route_part in route.parts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare incremental and whole route simplification.')
+    parser.add_argument('--size', type=int, default=1000, help='Route size in points of the NumPy geometry.')
+    parser.add_argument('--shapely-size', type=int, default=100, help='Route size in points of the Shapely geometry.')
+    parser.add_argument('--steps', type=int, nargs='+', default=[1, 7, 50], help='Points appended at once.')
+    parser.add_argument('--scenarios', choices=SCENARIOS, nargs='+', default=SCENARIOS,
+                        help='Scenarios of generated routes.')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'scenario':>14} {'geometry':>9} {'points':>7} {'step':>5} {'appends s':>10} {'whole s':>8} {'parts':>6} "
+          f"{'same':>6} {'diffs same':>11}")
+    for scenario in args.scenarios:
+        for geometry, size in (("numpy", args.size), ("shapely", args.shapely_size)):
+            route = generate_route(size, seed=3, scenario=scenario)
+            start = time.perf_counter()
+            expected = route_values(simplify(Points(route.lat, route.lon, zone=route.zone), geometry))
+            whole = time.perf_counter() - start
+
+            for step in args.steps:
+                simplifier = IncrementalSimplifier(geometry, zone=route.zone)
+                rebuilt = Route([])
+                start = time.perf_counter()
+                for i in range(0, len(route), step):
+                    simplifier.append(route[i:i + step]).apply(rebuilt)
+                appends = time.perf_counter() - start
+
+                same = route_values(simplifier.route) == expected
+                diffs_same = route_values(rebuilt) == expected
+                failed = failed or not (same and diffs_same)
+                print(f"{scenario:>14} {geometry:>9} {size:>7} {step:>5} {appends:>10.3f} {whole:>8.3f} "
+                      f"{len(expected):>6} {str(same):>6} {str(diffs_same):>11}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark of peak memory of a route held as Points columns and as a list of Node objects, with the __slots__
+classes of node.py and with the classes of the object model before Points, which kept attributes in a __dict__.
+
+Every measurement runs in a fresh process and counts allocations with tracemalloc, which NumPy reports its arrays to,
+so memory freed by the route generator and reused by the model is not hidden. Run from the repository root:
+    python3 -m benchmarks.memory --sizes 100000 1000000
+"""
+import argparse
+import tracemalloc
+from multiprocessing import get_context
+from typing import Tuple
+
+from benchmarks.generator import generate_route
+from node import LatLon, UTM, Node
+from points import Points
+
+MODELS = ("dicts", "slots", "points")
+
+
+class DictLatLon:
+    # LatLon, UTM and Node of the object model before Points, without __slots__.
+    def __init__(self, lat: float, lon: float):
+        self.lat = lat
+        self.lon = lon
+
+
+class DictUTM:
+    def __init__(self, north: float, east: float):
+        self.north = north
+        self.east = east
+
+
+class DictNode:
+    def __init__(self, latlon: DictLatLon, utm: DictUTM):
+        self.latlon = latlon
+        self.utm = utm
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets the peak resident set size of the process (Linux only).
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+
+
+def measure(model: str, size: int) -> Tuple[int, int]:
+    # Peak and retained bytes of the model.
+    route = generate_route(size)
+    lats, lons = route.lat.tolist(), route.lon.tolist()
+    del route
+
+    # Only allocations made while the model is built from the input lists are counted.
+    tracemalloc.start()
+    points = Points(lats, lons)
+    if model == "dicts":
+        # Object model of the readers before Points: Node, LatLon and UTM objects for every point.
+        route = [DictNode(DictLatLon(lat, lon), DictUTM(north, east))
+                 for lat, lon, north, east in zip(lats, lons, points.north.tolist(), points.east.tolist())]
+        del points
+    elif model == "slots":
+        route = [Node(LatLon(lat, lon), UTM(north, east, points.zone))
+                 for lat, lon, north, east in zip(lats, lons, points.north.tolist(), points.east.tolist())]
+        del points
+    else:
+        route = points
+
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark peak memory of route representations.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000], help='Route sizes in points.')
+    args = parser.parse_args()
+
+    context = get_context("spawn")
+    print(f"{'points':>10} {'model':>10} {'peak MB':>10} {'retained MB':>12} {'bytes/point':>12}")
+    for size in args.sizes:
+        for model in MODELS:
+            with context.Pool(1) as pool:
+                peak, retained = pool.apply(measure, (model, size))
+            print(f"{size:>10} {model:>10} {peak / 2 ** 20:>10.1f} {retained / 2 ** 20:>12.1f} "
+                  f"{retained / size:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark of every pipeline stage on synthetic routes, with regression checks against a saved baseline.
+
+Run from the repository root:
+    python3 -m benchmarks.pipeline --sizes 1000 10000 100000 1000000 --save-baseline baseline.json
+    python3 -m benchmarks.pipeline --sizes 1000 10000 100000 1000000 --baseline baseline.json
+Exits with a non-zero status if a stage is slower or takes more memory than the baseline allows.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+from typing import Dict, List
+
+from benchmarks.generator import generate_route, SCENARIOS
+from benchmarks.memory import reset_peak_rss, rss_kb
+from simplify import simplify_route
+from stats import PipelineStats
+
+STAGES = ("read", "create_node_pairs", "create_segments", "create_route", "write")
+
+
+def run_case(scenario: str, size: int, seed: int, repeat: int) -> Dict:
+    points = generate_route(size, seed, scenario)
+
+    # The median of the repeats is reported for every stage, memory is the largest peak RSS growth.
+    # Allocation tracing is off to keep timings honest.
+    stages = {stage: [] for stage in STAGES}
+    peak_rss = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path_from, path_to = os.path.join(directory, "input.json"), os.path.join(directory, "route.json")
+        with open(path_from, "w") as f:
+            json.dump([{"lat": lat, "lon": lon} for lat, lon in zip(points.lat.tolist(), points.lon.tolist())], f)
+        del points
+
+        for _ in range(repeat):
+            reset_peak_rss()
+            rss_before = rss_kb("VmRSS")
+            stats = PipelineStats(trace_allocations=False)
+            simplify_route(path_from, path_to, stats=stats, log=lambda message: None)
+            peak_rss = max(rss_kb("VmHWM") - rss_before, peak_rss)
+            for stage, seconds in stages.items():
+                seconds.append(stats.stages[stage]["seconds"])
+    stages = {stage: statistics.median(seconds) for stage, seconds in stages.items()}
+
+    seconds = sum(stages.values())
+    return {
+        "scenario": scenario,
+        "size": size,
+        "stages": stages,
+        "seconds": seconds,
+        "points_per_second": size / seconds,
+        "peak_rss_mb": peak_rss / 1024,
+        "counters": stats.counters
+    }
+
+
+def find_regressions(results: List[Dict], baseline: List[Dict], tolerance: float, noise: float,
+                     memory_noise: float) -> List[str]:
+    # Slowdowns and memory growth below the noise floors are not regressions.
+    baseline = {(case["scenario"], case["size"]): case for case in baseline}
+    regressions = []
+    for case in results:
+        expected = baseline.get((case["scenario"], case["size"]))
+        if expected is None:
+            continue
+        for stage in STAGES:
+            # Baselines saved before a stage was timed do not have it.
+            if stage not in expected["stages"]:
+                continue
+            seconds, expected_seconds = case["stages"][stage], expected["stages"][stage]
+            if seconds > max(expected_seconds * (1 + tolerance), expected_seconds + noise):
+                regressions.append(f"{case['scenario']} {case['size']} {stage}: {seconds:.3f} s, "
+                                   f"baseline {expected_seconds:.3f} s")
+        if case["peak_rss_mb"] > max(expected["peak_rss_mb"] * (1 + tolerance), expected["peak_rss_mb"] + memory_noise):
+            regressions.append(f"{case['scenario']} {case['size']} peak RSS: {case['peak_rss_mb']:.1f} MB, "
+                               f"baseline {expected['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pipeline stages on synthetic routes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Route sizes in points.')
+    parser.add_argument('--scenarios', choices=SCENARIOS, nargs='+', default=list(SCENARIOS),
+                        help='Route scenarios.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the route generator.')
+    parser.add_argument('--baseline', type=str, default="", help='Compare results with a saved baseline JSON.')
+    parser.add_argument('--save-baseline', type=str, default="", help='Save results as a baseline JSON.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown or memory growth against the baseline.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of every case. The median run is reported.')
+    parser.add_argument('--noise', type=float, default=0.1,
+                        help='Stage slowdowns below this many seconds always pass.')
+    parser.add_argument('--memory-noise', type=float, default=16,
+                        help='Peak RSS growth below this many megabytes always passes.')
+    args = parser.parse_args()
+
+    print(f"{'scenario':>14} {'points':>9} " + " ".join(f"{stage:>17}" for stage in STAGES)
+          + f" {'points/s':>10} {'peak MB':>8}")
+    results = []
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            case = run_case(scenario, size, args.seed, args.repeat)
+            results.append(case)
+            print(f"{scenario:>14} {size:>9} " + " ".join(f"{case['stages'][stage]:>17.3f}" for stage in STAGES)
+                  + f" {case['points_per_second']:>10.0f} {case['peak_rss_mb']:>8.1f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance, args.noise, args.memory_noise)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Check and benchmark of reducing dense GPS traces (reduce_points) on streets driven more than once.
+
+Run from the repository root:
+    python3 -m benchmarks.reduction --tolerances 0.5 1 5
+Exits with a non-zero status if no points are removed or if pair frequencies are not kept: every pair of a loop driven
+LOOP_LAPS times has to be driven LOOP_LAPS times, and streets of densified generator routes have to be driven as many
+times on average as without reduction.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.generator import generate_route
+from node_pair import create_node_pairs, PairGraph
+from points import Points
+from reduction import reduce_points
+
+LOOP_LAPS = 3
+MIN_PASSES_RATIO = 0.99  # Allowed ratio of average passes of reduced and not reduced generator routes
+
+
+def densify(route: Points, spacing: float, noise: float = 0.1, seed: int = 0) -> Points:
+    # A point every spacing meters along the route with normal GPS noise in meters.
+    rng = np.random.default_rng(seed)
+    arc = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(route.north), np.diff(route.east)))])
+    positions = np.arange(0, arc[-1], spacing)
+    north = np.interp(positions, arc, route.north) + rng.normal(0, noise, len(positions))
+    east = np.interp(positions, arc, route.east) + rng.normal(0, noise, len(positions))
+    return Points.from_utm(north, east, route.zone)
+
+
+def loop(laps: int, spacing: float) -> Points:
+    # A circle of 100 meters radius driven laps times with a point every spacing meters, without noise.
+    angles = np.append(np.tile(np.arange(0, 2 * np.pi, spacing / 100), laps), 0)
+    origin = generate_route(1)
+    return Points.from_utm(origin.north[0] + 100 * np.sin(angles), origin.east[0] + 100 * np.cos(angles), origin.zone)
+
+
+def passes(graph: PairGraph) -> float:
+    # How many times streets of the route are driven on average, weighted by lengths of pairs.
+    lengths = np.array([pair.node_from.utm - pair.node_to.utm for pair in graph.pairs])
+    return float(np.dot(graph.frequencies, lengths) / lengths.sum()) if len(lengths) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check reduction of dense traces driving streets more than once.')
+    parser.add_argument('--tolerances', type=float, nargs='+', default=[0.5, 1, 5], help='Tolerances in meters.')
+    parser.add_argument('--size', type=int, default=400, help='Points of generator routes before densifying.')
+    args = parser.parse_args()
+
+    cases = [(f"loop x{LOOP_LAPS} 1m", loop(LOOP_LAPS, 1))] + \
+            [(f"{scenario} 5m", densify(generate_route(args.size, seed=1, scenario=scenario), 5))
+             for scenario in ("laps", "intersections")]
+
+    failed = False
+    print(f"{'route':>18} {'tolerance':>10} {'points':>8} {'reduced':>8} {'seconds':>8} {'pairs':>6} "
+          f"{'reduced':>8} {'passes':>7} {'reduced':>8} {'ok':>6}")
+    for name, route in cases:
+        graph = create_node_pairs(route)
+        for tolerance in args.tolerances:
+            start = time.perf_counter()
+            reduced, _, _ = reduce_points(route, tolerance)
+            seconds = time.perf_counter() - start
+            reduced_graph = create_node_pairs(reduced)
+
+            # Pairs of the dense loop are shorter than MIN_PAIR_LENGTH, it has no pairs without reduction.
+            if name.startswith("loop"):
+                kept = set(reduced_graph.frequencies) == {LOOP_LAPS}
+            else:
+                kept = passes(reduced_graph) >= MIN_PASSES_RATIO * passes(graph)
+            ok = kept and len(reduced) < len(route)
+            failed = failed or not ok
+            print(f"{name:>18} {tolerance:>10g} {len(route):>8} {len(reduced):>8} {seconds:>8.3f} "
+                  f"{len(graph.order):>6} {len(reduced_graph.order):>8} {passes(graph):>7.3f} "
+                  f"{passes(reduced_graph):>8.3f} {str(ok):>6}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Benchmark of lane connection (create_route) on high-repetition routes.
+
+Laps drive the same loop again and again, so every pair has hundreds or thousands of lanes.
+Run from the repository root:
+    python3 -m benchmarks.route --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+from benchmarks.generator import generate_route, SCENARIOS
+from node_pair import create_node_pairs
+from route import create_route
+from segment import create_segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lane connection on high-repetition routes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Route sizes in points.')
+    parser.add_argument('--scenario', choices=SCENARIOS, default="laps", help='Scenario of generated routes.')
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'pairs':>10} {'max lanes':>10} {'seconds':>10} {'steps/s':>12}")
+    for size in args.sizes:
+        graph = create_node_pairs(generate_route(size, scenario=args.scenario))
+        segments = create_segments(graph)
+
+        start = time.perf_counter()
+        create_route(segments, graph)
+        elapsed = time.perf_counter() - start
+
+        steps = max(len(graph.order) - 1, 0)
+        print(f"{size:>10} {len(graph):>10} {max(graph.frequencies, default=0):>10} {elapsed:>10.3f} "
+              f"{steps / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
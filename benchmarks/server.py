@@ -0,0 +1,107 @@
+"""Load test of the local simplification server.
+
+Starts the server on a free localhost port, sends concurrent requests of generated routes over HTTP/1.1 keep-alive
+connections and prints throughput and the server's metrics. Run from the repository root:
+    python3 -m benchmarks.server --requests 200 --size 1000 --concurrency 32 --workers 4
+Exits with a non-zero status if a response differs from simplify of the same route.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Tuple
+
+from benchmarks.generator import generate_route, SCENARIOS
+from io_handler import encode_route
+from server import SimplifyServer, BATCH_SIZE
+from simplify import simplify
+
+
+class Client:
+    """Client is a minimal HTTP/1.1 client keeping a connection to the server open."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+                          .encode("latin-1") + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run(args: argparse.Namespace) -> bool:
+    routes = [generate_route(args.size, seed=i, scenario=args.scenario) for i in range(args.distinct)]
+    bodies = [json.dumps([{"lat": lat, "lon": lon} for lat, lon in zip(route.lat.tolist(), route.lon.tolist())])
+              .encode("utf-8") for route in routes]
+    expected = [encode_route(simplify(route), "json") for route in routes]
+
+    start = time.perf_counter()
+    server = SimplifyServer(args.workers, batch_size=args.batch_size, batch_delay=args.batch_delay / 1000)
+    listener = await server.start("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    print(f"Started {server.workers} warm workers in {time.perf_counter() - start:.2f} s")
+
+    same = True
+    requests = iter(range(args.requests))
+
+    async def send(client: Client):
+        nonlocal same
+        for i in requests:
+            status, body = await client.request("POST", "/simplify?input=json&output=json",
+                                                bodies[i % args.distinct])
+            same = same and status == 200 and body == expected[i % args.distinct]
+
+    clients = [Client(port) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(send(client) for client in clients))
+    elapsed = time.perf_counter() - start
+
+    status, metrics = await clients[0].request("GET", "/metrics")
+    for client in clients:
+        client.close()
+    await server.close()
+
+    print(f"{args.requests} requests of {args.size} points in {elapsed:.2f} s, "
+          f"{args.requests / elapsed:.1f} requests/s")
+    print(json.dumps(json.loads(metrics), indent=2))
+    print(f"Responses same as simplify: {same}")
+    return same and status == 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the simplification server.')
+    parser.add_argument('--requests', type=int, default=200, help='Number of requests.')
+    parser.add_argument('--size', type=int, default=1000, help='Route size in points.')
+    parser.add_argument('--distinct', type=int, default=8, help='Number of distinct routes sent.')
+    parser.add_argument('--concurrency', type=int, default=32, help='Number of concurrent connections.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Maximum number of requests in a batch.')
+    parser.add_argument('--batch-delay', type=float, default=0.0, help='Milliseconds to wait for a batch.')
+    parser.add_argument('--scenario', choices=SCENARIOS, default="intersections", help='Scenario of generated routes.')
+    args = parser.parse_args()
+
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == '__main__':
+    main()
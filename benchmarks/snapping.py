@@ -0,0 +1,36 @@
+"""Benchmark of node snapping (snap_node_pairs) used by create_node_pairs.
+
+Run from the repository root:
+    python3 -m benchmarks.snapping --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.generator import generate_route
+from node_pair import snap_node_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark node snapping.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Route sizes in points.')
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'pairs':>10} {'distinct':>10} {'seconds':>10} {'points/s':>12}")
+    for size in args.sizes:
+        route = generate_route(size)
+
+        starts = np.arange(len(route) - 1)
+
+        start = time.perf_counter()
+        snapped_pairs_order = snap_node_pairs(route, starts)
+        elapsed = time.perf_counter() - start
+
+        distinct = len(set(map(id, snapped_pairs_order)))
+        print(f"{size:>10} {len(snapped_pairs_order):>10} {distinct:>10} {elapsed:>10.3f} {size / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
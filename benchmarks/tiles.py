@@ -0,0 +1,78 @@
+"""Parity check and benchmark of tiled segment creation against the single-process create_segments.
+
+Run from the repository root on a machine with several cores:
+    python3 -m benchmarks.tiles --sizes 100000 1000000 --workers 1 2 4 8
+Exits with a non-zero status if lanes of tiled and untiled segments are not identical. Seam pairs have a neighbor in
+another tile, their cut distances come from the halo of the tile.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.generator import generate_route, SCENARIOS
+from node_pair import create_node_pairs, PairGraph
+from segment import create_segments
+from tiles import create_tiled_segments, partition_pairs
+
+TILE_SIZE = 250  # meters. Routes of the generator span a few kilometers, so small tiles are needed for many seams
+
+
+def lane_values(segments) -> np.ndarray:
+    # An array rather than Python objects, so that it does not slow down forking of the worker processes.
+    return np.array([[lane.segment.offset_multiplier] +
+                     [value for node in lane.segment.nodes
+                      for value in (node.latlon.lat, node.latlon.lon, node.utm.north, node.utm.east)]
+                     for lanes in segments for lane in lanes])
+
+
+def count_seam_pairs(graph: PairGraph, tile_size: float) -> int:
+    tiles = {pair_id: i for i, pair_ids in enumerate(partition_pairs(graph, tile_size))
+             for pair_id in pair_ids.tolist()}
+    return sum(any(tiles[neighbor_id] != tiles[pair_id] for neighbor_id in graph.comes_from[pair_id] |
+                   graph.leads_to[pair_id]) for pair_id in range(len(graph)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare tiled and untiled segment creation.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Route sizes in points.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worker processes.')
+    parser.add_argument('--tile-size', type=float, default=TILE_SIZE, help='Size of tiles in meters. Small tiles put '
+                                                                            'more pairs at seams.')
+    parser.add_argument('--scenario', choices=SCENARIOS, default="intersections", help='Scenario of generated routes.')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{os.cpu_count()} CPUs, tiles of {args.tile_size:g} m")
+    print(f"{'points':>10} {'pairs':>8} {'tiles':>6} {'seams':>6} {'workers':>8} {'untiled s':>10} {'tiled s':>10} "
+          f"{'speedup':>8} {'same':>6}")
+    for size in args.sizes:
+        route = generate_route(size, scenario=args.scenario)
+
+        graph = create_node_pairs(route)
+        tiles, seams = len(partition_pairs(graph, args.tile_size)), count_seam_pairs(graph, args.tile_size)
+        start = time.perf_counter()
+        segments = create_segments(graph)
+        untiled = time.perf_counter() - start
+        expected = lane_values(segments)
+        del segments
+
+        for workers in args.workers:
+            graph = create_node_pairs(route)
+            start = time.perf_counter()
+            segments = create_tiled_segments(graph, workers, args.tile_size)
+            tiled = time.perf_counter() - start
+
+            same = np.array_equal(lane_values(segments), expected)
+            del segments
+            failed = failed or not same
+            print(f"{size:>10} {len(graph):>8} {tiles:>6} {seams:>6} {workers:>8} {untiled:>10.3f} {tiled:>10.3f} "
+                  f"{untiled / tiled:>8.2f} {str(same):>6}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import hashlib
+import sqlite3
+import struct
+import time
+from typing import List, Dict, Optional, Iterable, Tuple
+
+import numpy as np
+
+import config
+from coordinates import Zone
+from node_pair import NodePair, PairGraph
+from options import SimplifyOptions
+from points import Points
+from route import Route, RoutePart, Connection, Lane
+from segment import Segment, create_segments
+
+TIERS = ("routes", "segments")
+SQL_VARIABLES = 500  # Keys looked up in a single query. SQLite limits the number of query parameters
+
+
+def config_fingerprint(options: SimplifyOptions = None) -> bytes:
+    # Values of config.py and the options replacing them change the output, so they are a part of every key.
+    values = {name: value for name, value in vars(config).items() if name.isupper()}
+    values.update((options if options is not None else SimplifyOptions()).to_config())
+    return repr(sorted(values.items())).encode()
+
+
+class RouteCache:
+    """RouteCache is a persistent cache of simplified routes and of lanes of pairs in a SQLite database.
+
+    Routes are keyed by a hash of their points, the geometry backend and the values of config.py with the options.
+    Lanes of a pair are keyed by a hash of the pair, its neighbors with their frequencies, its frequency, the geometry
+    backend, the config and the options, so routes over known streets reuse them. The least recently used entries of
+    both tiers are evicted when stored values grow over max_bytes. The database can be shared by processes."""
+
+    def __init__(self, path: str, max_bytes: int = 2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits: Dict[str, int] = {tier: 0 for tier in TIERS}
+        self.misses: Dict[str, int] = {tier: 0 for tier in TIERS}
+
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            for tier in TIERS:
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {tier} "
+                                        f"(key BLOB PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)")
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {tier}_accessed ON {tier} (accessed)")
+            # Total size of stored values is kept in the database, so all processes see the same size.
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('bytes', 0)")
+
+    def __str__(self):
+        return f"RouteCache(path: {self.path}, hits: {self.hits}, misses: {self.misses})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self) -> "RouteCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def size(self) -> int:
+        return self.connection.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def get(self, tier: str, keys: List[bytes]) -> Dict[bytes, bytes]:
+        """Return stored values of the keys found in the tier and mark them as recently used."""
+        values = dict()
+        for start in range(0, len(keys), SQL_VARIABLES):
+            chunk = keys[start:start + SQL_VARIABLES]
+            values.update(self.connection.execute(
+                f"SELECT key, value FROM {tier} WHERE key IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+
+        if values:
+            accessed = time.time()
+            with self.connection:
+                self.connection.executemany(f"UPDATE {tier} SET accessed = ? WHERE key = ?",
+                                            ((accessed, key) for key in values))
+        self.hits[tier] += len(values)
+        self.misses[tier] += len(keys) - len(values)
+        return values
+
+    def put(self, tier: str, items: Iterable[Tuple[bytes, bytes]]):
+        # Keys are hashes of the content, so an existing value is never replaced.
+        accessed = time.time()
+        with self.connection:
+            added = 0
+            for key, value in items:
+                if self.connection.execute(f"INSERT OR IGNORE INTO {tier} VALUES (?, ?, ?, ?)",
+                                           (key, value, len(value), accessed)).rowcount:
+                    added += len(value)
+            self.connection.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (added,))
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries of both tiers until stored values fit into max_bytes."""
+        with self.connection:
+            excess = self.size - self.max_bytes
+            if excess <= 0:
+                return
+
+            evicted = {tier: [] for tier in TIERS}
+            freed = 0
+            rows = self.connection.execute("SELECT 'routes', key, size, accessed FROM routes UNION ALL "
+                                           "SELECT 'segments', key, size, accessed FROM segments ORDER BY accessed")
+            for tier, key, size, _ in rows:
+                if freed >= excess:
+                    break
+                evicted[tier].append((key,))
+                freed += size
+
+            for tier, keys in evicted.items():
+                self.connection.executemany(f"DELETE FROM {tier} WHERE key = ?", keys)
+            self.connection.execute("UPDATE meta SET value = value - ? WHERE name = 'bytes'", (freed,))
+
+    def get_route(self, key: bytes) -> Optional[Route]:
+        value = self.get("routes", [key]).get(key)
+        return decode_route(value) if value is not None else None
+
+    def put_route(self, key: bytes, route: Route):
+        self.put("routes", [(key, encode_route(route))])
+
+    def hit_rate(self, tier: str) -> float:
+        lookups = self.hits[tier] + self.misses[tier]
+        return self.hits[tier] / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            **{tier: {"hits": self.hits[tier], "misses": self.misses[tier], "hit_rate": self.hit_rate(tier)}
+               for tier in TIERS}
+        }
+
+
+def route_key(points: Points, geometry: str, options: SimplifyOptions = None) -> bytes:
+    key = hashlib.blake2b(b"route", digest_size=16)
+    key.update(config_fingerprint(options))
+    key.update(geometry.encode())
+    key.update(np.ascontiguousarray(points.lat, dtype="<f8"))
+    key.update(np.ascontiguousarray(points.lon, dtype="<f8"))
+    return key.digest()
+
+
+def lanes_key(graph: PairGraph, pair_id: int, prefix: bytes) -> bytes:
+    # Lanes of a pair depend on the pair, on its neighbors and their frequencies and on its frequency.
+    def values(pair: NodePair) -> Tuple[float, ...]:
+        return pair.node_from.utm.north, pair.node_from.utm.east, pair.node_to.utm.north, pair.node_to.utm.east
+
+    key = hashlib.blake2b(prefix, digest_size=16)
+    key.update(struct.pack("<4dq", *values(graph.pairs[pair_id]), graph.frequencies[pair_id]))
+    for neighbors in (graph.comes_from[pair_id], graph.leads_to[pair_id]):
+        rows = sorted(values(graph.pairs[neighbor_id]) + (graph.frequencies[neighbor_id],) for neighbor_id in neighbors)
+        key.update(struct.pack("<q", len(rows)))
+        for row in rows:
+            key.update(struct.pack("<4dq", *row))
+    return key.digest()
+
+
+def create_cached_segments(graph: PairGraph, backend: str, cache: RouteCache,
+                           options: SimplifyOptions = None) -> List[List[Lane]]:
+    """Return lanes of every pair indexed by pair id like create_segments. Lanes found in the cache are not created
+    again, created lanes are stored in the cache."""
+    if not graph.pairs:
+        return []
+    zone = graph.pairs[0].node_from.utm.zone
+    prefix = b"lanes" + config_fingerprint(options) + backend.encode() + struct.pack("<q?", zone.number, zone.northern)
+    keys = [lanes_key(graph, pair_id, prefix) for pair_id in range(len(graph))]
+    values = cache.get("segments", keys)
+
+    segments: List[List[Lane]] = [[] for _ in range(len(graph))]
+    missing = []
+    for pair_id, key in enumerate(keys):
+        if key in values:
+            segments[pair_id] = [Lane(Segment(graph.pairs[pair_id], multiplier, nodes))
+                                 for multiplier, nodes in enumerate(decode_lanes(values[key], zone))]
+        else:
+            missing.append(pair_id)
+
+    if missing:
+        for pair_id, lanes in zip(missing, create_segments(graph, backend, missing, options)):
+            segments[pair_id] = lanes
+        cache.put("segments", ((keys[pair_id], encode_lanes(segments[pair_id])) for pair_id in missing))
+
+    return segments
+
+
+def node_rows(nodes: Iterable) -> List[Tuple[float, float, float, float]]:
+    return [(node.latlon.lat, node.latlon.lon, node.utm.north, node.utm.east) for node in nodes]
+
+
+def rows_to_nodes(rows: np.ndarray, zone: Zone) -> List:
+    return list(Points(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3], zone))
+
+
+def encode_lanes(lanes: List[Lane]) -> bytes:
+    # Number of nodes of every lane followed by latitudes, longitudes, norths and easts of all nodes.
+    sizes = np.array([len(lane.segment.nodes) for lane in lanes], dtype="<i8")
+    rows = np.array([row for lane in lanes for row in node_rows(lane.segment.nodes)], dtype="<f8").reshape(-1, 4)
+    return struct.pack("<q", len(lanes)) + sizes.tobytes() + rows.tobytes()
+
+
+def decode_lanes(value: bytes, zone: Zone) -> List[List]:
+    count = struct.unpack_from("<q", value)[0]
+    sizes = np.frombuffer(value, dtype="<i8", count=count, offset=8)
+    nodes = rows_to_nodes(np.frombuffer(value, dtype="<f8", offset=8 + sizes.nbytes).reshape(-1, 4), zone)
+    bounds = np.concatenate([[0], np.cumsum(sizes)]).tolist()
+    return [nodes[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+
+def encode_route(route: Route) -> bytes:
+    # Connections share nodes with segments and segments of a pair share the pair, so distinct nodes and pairs are
+    # stored once. Header (numbers of parts, pairs, node references and nodes, zone) is followed by columns of parts
+    # (kind, number of nodes, pair id, offset multiplier), pair ids with nodes of pairs, node indices of all parts
+    # and distinct nodes.
+    node_indices = dict()
+    nodes = []
+    references = []
+    for part in route.parts:
+        for node in part.nodes:
+            if id(node) not in node_indices:
+                node_indices[id(node)] = len(nodes)
+                nodes.append(node)
+            references.append(node_indices[id(node)])
+
+    pairs = {part.pair.id: part.pair for part in route.parts if isinstance(part, Segment)}
+    parts = np.array([(1, len(part.nodes), part.pair.id, part.offset_multiplier) if isinstance(part, Segment)
+                      else (0, len(part.nodes), -1, -1) for part in route.parts], dtype="<i8").reshape(-1, 4)
+    pair_ids = np.array(list(pairs), dtype="<i8")
+    pair_rows = np.array([node_rows([pair.node_from, pair.node_to]) for pair in pairs.values()],
+                         dtype="<f8").reshape(-1, 8)
+    references = np.array(references, dtype="<i8")
+    rows = np.array(node_rows(nodes), dtype="<f8").reshape(-1, 4)
+
+    zone = nodes[0].utm.zone if nodes else Zone(0, True)
+    header = struct.pack("<qqqqq?", len(parts), len(pairs), len(references), len(nodes), zone.number, zone.northern)
+    return header + parts.tobytes() + pair_ids.tobytes() + pair_rows.tobytes() + references.tobytes() + rows.tobytes()
+
+
+def decode_route(value: bytes) -> Route:
+    header = struct.Struct("<qqqqq?")
+    parts_count, pairs_count, references_count, nodes_count, zone_number, northern = header.unpack_from(value)
+    zone = Zone(zone_number, northern)
+
+    columns = []
+    offset = header.size
+    for dtype, count in (("<i8", parts_count * 4), ("<i8", pairs_count), ("<f8", pairs_count * 8),
+                         ("<i8", references_count), ("<f8", nodes_count * 4)):
+        columns.append(np.frombuffer(value, dtype=dtype, count=count, offset=offset))
+        offset += columns[-1].nbytes
+    parts, pair_ids, pair_rows, references, rows = columns
+
+    # Pairs are recreated for segments, so segments keep their pair ids.
+    pair_nodes = rows_to_nodes(pair_rows.reshape(-1, 4), zone)
+    pairs = dict()
+    for i, pair_id in enumerate(pair_ids.tolist()):
+        pairs[pair_id] = NodePair(pair_nodes[2 * i], pair_nodes[2 * i + 1])
+        pairs[pair_id].id = pair_id
+
+    distinct_nodes = rows_to_nodes(rows.reshape(-1, 4), zone)
+    nodes = [distinct_nodes[i] for i in references.tolist()]
+
+    route_parts: List[RoutePart] = []
+    start = 0
+    for kind, size, pair_id, multiplier in parts.reshape(-1, 4).tolist():
+        part_nodes = nodes[start:start + size]
+        start += size
+        route_parts.append(Segment(pairs[pair_id], multiplier, part_nodes) if kind else Connection(*part_nodes))
+    return Route(route_parts)
@@ -0,0 +1,186 @@
+from collections import OrderedDict, Counter
+from typing import List, Iterator, Callable, Iterable, Tuple, Dict
+
+import numpy as np
+
+from coordinates import Zone
+from io_handler import read_route_chunks, save_route_parts, route_format
+from node_pair import PairGraph, PairSnapper, extend_node_pairs, route_node_pairs
+from options import SimplifyOptions
+from points import Points
+from route import RoutePart, Lane, FreeLanes, connect_route
+from segment import create_segments
+from stats import PipelineStats
+
+CHUNK_SIZE = 1_000_000  # Points read and connected at once
+MAX_LANES = 100_000  # Lanes kept by LaneCache, about a kilobyte each
+
+
+class PairLanes:
+    """PairLanes are lanes of a pair indexed by offset multiplier like a list of lanes in segments. Lanes are taken
+    from LaneCache, which creates them on demand."""
+
+    def __init__(self, cache: "LaneCache", pair_id: int):
+        self.cache = cache
+        self.pair_id = pair_id
+
+    def __len__(self):
+        return self.cache.graph.frequencies[self.pair_id]
+
+    def __getitem__(self, multiplier: int) -> Lane:
+        return self.cache.lane(self.pair_id, multiplier)
+
+
+class LaneCache:
+    """LaneCache creates lanes on demand and keeps the most recently used max_lanes lanes. A pair has a lane for
+    every time it is driven, so lanes of all pairs grow with the route, while lanes taken in a chunk do not. Lanes
+    created again after eviction are the same, cut distances are memoized on the graph. It replaces segments indexed
+    by pair id when lanes are connected."""
+
+    def __init__(self, graph: PairGraph, geometry: str = "numpy", options: SimplifyOptions = None,
+                 max_lanes: int = MAX_LANES):
+        self.graph = graph
+        self.geometry = geometry
+        self.options = options
+        self.max_lanes = max_lanes
+        self.lanes: Dict[Tuple[int, int], Lane] = OrderedDict()  # Keyed by pair id and offset multiplier
+        self.created = 0  # Lanes created, again after eviction too
+        self.evicted = 0
+
+    def __str__(self):
+        return f"LaneCache(lanes: {len(self.lanes)}, created: {self.created}, evicted: {self.evicted})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __getitem__(self, pair_id: int) -> PairLanes:
+        return PairLanes(self, pair_id)
+
+    def lane(self, pair_id: int, multiplier: int) -> Lane:
+        if (pair_id, multiplier) not in self.lanes:
+            self.create({pair_id: [multiplier]})
+            self.evict(1)
+        self.lanes.move_to_end((pair_id, multiplier))
+        return self.lanes[(pair_id, multiplier)]
+
+    def load(self, order: List[int], free_lanes: FreeLanes):
+        """Create all lanes the pairs of the order can take in one call. A pair met n times takes lanes only from
+        the n left most and the n right most of its unused lanes. The lanes are kept even if there are more than
+        max_lanes of them."""
+        wanted: Dict[int, List[int]] = {}
+        for pair_id, count in Counter(order).items():
+            left = free_lanes.lefts.get(pair_id, 0)
+            right = free_lanes.rights.get(pair_id, self.graph.frequencies[pair_id] - 1)
+            wanted[pair_id] = sorted(set(range(left, min(left + count, right + 1))) |
+                                     set(range(max(right - count + 1, left), right + 1)))
+
+        self.create({pair_id: [multiplier for multiplier in multipliers if (pair_id, multiplier) not in self.lanes]
+                     for pair_id, multipliers in wanted.items()})
+        for pair_id, multipliers in wanted.items():
+            for multiplier in multipliers:
+                self.lanes.move_to_end((pair_id, multiplier))
+        self.evict(sum(len(multipliers) for multipliers in wanted.values()))
+
+    def create(self, multipliers: Dict[int, List[int]]):
+        # Lanes with the offset multipliers of every pair id.
+        pair_ids = [pair_id for pair_id, pair_multipliers in multipliers.items() if pair_multipliers]
+        if not pair_ids:
+            return
+        lane_multipliers = [multipliers[pair_id] for pair_id in pair_ids]
+        for pair_id, lanes in zip(pair_ids, create_segments(self.graph, self.geometry, pair_ids, self.options,
+                                                            lane_multipliers)):
+            for lane in lanes:
+                self.lanes[(pair_id, lane.segment.offset_multiplier)] = lane
+            self.created += len(lanes)
+
+    def evict(self, kept: int):
+        # Evict the least recently used lanes except the last kept ones.
+        while len(self.lanes) > max(self.max_lanes, kept):
+            self.lanes.popitem(last=False)
+            self.evicted += 1
+
+
+def route_chunks(path: str, chunk_size: int = CHUNK_SIZE, zone: Zone = None) -> Iterator[Points]:
+    """Stream points of a route file in chunks projected into the same zone, the zone of the first chunk unless it is
+    given. Every chunk after the first one starts with the last point of the previous chunk, so pairs continue."""
+    last_point = None
+    for lats, lons in read_route_chunks(path, chunk_size):
+        points = Points(lats, lons, zone=zone)
+        zone = points.zone
+        if last_point is not None:
+            points = Points(np.concatenate([last_point.lat, points.lat]), np.concatenate([last_point.lon, points.lon]),
+                            np.concatenate([last_point.north, points.north]),
+                            np.concatenate([last_point.east, points.east]), zone)
+        last_point = points[-1:]
+        yield points
+
+
+def count_pairs(chunks: Iterable[Points]) -> Tuple[PairGraph, PairSnapper]:
+    """The first pass. Count frequencies of pairs and link them. Only the last pair of graph.order is kept to link
+    the next chunk, so memory depends on the number of distinct pairs, not on the route length.
+    first_positions of the graph are not meaningful."""
+    graph = PairGraph()
+    snapper = PairSnapper()
+    for chunk in chunks:
+        extend_node_pairs(graph, chunk, snapper)
+        del graph.order[:-1]
+    return graph, snapper
+
+
+def stream_route_parts(chunks: Iterable[Points], graph: PairGraph, snapper: PairSnapper,
+                       lanes: LaneCache) -> Iterator[RoutePart]:
+    """The second pass. Snap the chunks again and connect lanes of their pairs, yielding route parts as soon as they
+    are connected. The snapper of the first pass snaps every point to the same canonical node again: all canonical
+    nodes exist already and the earliest one is preferred, which is the one the point was snapped to before."""
+    free_lanes = FreeLanes(lanes)
+    last_pair_id, last_lane = None, None
+    for chunk in chunks:
+        order = [pair.id for pair in route_node_pairs(chunk, snapper)[0]]
+        if not order:
+            continue
+        lanes.load(order, free_lanes)
+
+        # Connecting continues from the last lane of the previous chunk.
+        if last_lane is not None:
+            order.insert(0, last_pair_id)
+        route_parts: List[RoutePart] = []
+        used_lanes = [last_lane] if last_lane is not None else []
+        connect_route(lanes, graph, route_parts, used_lanes, order=order, free_lanes=free_lanes)
+
+        # The last segment is followed by a connection to the next chunk.
+        yield from route_parts[:-1]
+        last_pair_id, last_lane = order[-1], used_lanes[-1]
+
+    if last_lane is not None:
+        yield last_lane.segment
+
+
+def simplify_chunked(path_from: str, path_to: str, geometry: str = "numpy", options: SimplifyOptions = None,
+                     chunk_size: int = CHUNK_SIZE, max_lanes: int = MAX_LANES, pretty_print: bool = True,
+                     stats: PipelineStats = None, log: Callable[[str], None] = print):
+    """Simplify a route file larger than memory in two passes over the file. The first pass counts pairs, the second
+    one creates lanes on demand and writes route parts while they are connected. Memory depends on the number of
+    distinct pairs, max_lanes and the chunk size, not on the route length. The result is the same as of
+    simplify_route if the route is in a single zone. Points are projected into the zone of the first chunk."""
+    stats = stats if stats is not None else PipelineStats(trace_allocations=False)
+    if route_format(path_to) == "binary":
+        raise Exception("Chunked routes can be saved only as .json or .osm")
+
+    log("Counting pairs...")
+    with stats.stage("count_pairs"):
+        graph, snapper = count_pairs(route_chunks(path_from, chunk_size))
+    stats.count("dropped_pairs", graph.dropped_pairs)
+    stats.count("route_pairs", sum(graph.frequencies))
+    stats.count("distinct_pairs", len(graph))
+    log(f"Counted {sum(graph.frequencies)} pairs, {len(graph)} distinct")
+
+    log("Simplifying and saving the route...")
+    zone = graph.pairs[0].node_from.utm.zone if graph.pairs else None
+    lanes = LaneCache(graph, geometry, options, max_lanes)
+    with stats.stage("simplify_and_write"):
+        save_route_parts(stream_route_parts(route_chunks(path_from, chunk_size, zone), graph, snapper, lanes),
+                         path_to, pretty_print)
+    stats.count("lane_cache_created", lanes.created)
+    stats.count("lane_cache_evicted", lanes.evicted)
+    log(f"Route saved as {path_to}")
+    log("Done.")
@@ -0,0 +1,72 @@
+from typing import Tuple, Sequence
+
+import numpy as np
+from utm import from_latlon, to_latlon, latlon_to_zone_number
+
+CHUNK_SIZE = 65536  # utm allocates many temporary arrays, so long routes are converted in chunks
+
+
+class Zone:
+    """Zone is a UTM zone. All coordinates of a route are converted within a single zone."""
+
+    def __init__(self, number: int, northern: bool):
+        self.number = number
+        self.northern = northern
+
+    def __str__(self):
+        return f"Zone(number: {self.number}, northern: {self.northern})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __eq__(self, other):
+        return isinstance(other, Zone) and self.number == other.number and self.northern == other.northern
+
+    def __hash__(self):
+        return hash((self.number, self.northern))
+
+
+def find_zone(lats: Sequence[float], lons: Sequence[float]) -> Zone:
+    # Routes crossing a zone boundary (or the equator) are projected into the zone of their median point.
+    # utm extends the projection of a zone beyond its boundaries, so geometry of the route stays continuous
+    # instead of jumping by hundreds of kilometers at the boundary.
+    lat = float(np.median(lats))
+    lon = float(np.median(lons))
+    return Zone(latlon_to_zone_number(lat, lon), lat >= 0)
+
+
+def latlon_to_utm(lats: Sequence[float], lons: Sequence[float],
+                  zone: Zone = None) -> Tuple[np.ndarray, np.ndarray, Zone]:
+    """Convert arrays of latitudes and longitudes to arrays of norths and easts in one call."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if len(lats) == 0:
+        return np.empty(0), np.empty(0), zone
+
+    if zone is None:
+        zone = find_zone(lats, lons)
+
+    norths = np.empty(len(lats))
+    easts = np.empty(len(lats))
+    for start in range(0, len(lats), CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        easts[chunk], norths[chunk], _, _ = from_latlon(lats[chunk], lons[chunk], force_zone_number=zone.number,
+                                                        force_northern=zone.northern)
+    return norths, easts, zone
+
+
+def utm_to_latlon(norths: Sequence[float], easts: Sequence[float], zone: Zone) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert arrays of norths and easts of a zone to arrays of latitudes and longitudes in one call."""
+    norths = np.asarray(norths, dtype=np.float64)
+    easts = np.asarray(easts, dtype=np.float64)
+    if len(norths) == 0:
+        return np.empty(0), np.empty(0)
+
+    # Points of routes crossing a zone boundary are allowed to lie outside of the zone.
+    lats = np.empty(len(norths))
+    lons = np.empty(len(norths))
+    for start in range(0, len(norths), CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        lats[chunk], lons[chunk] = to_latlon(easts[chunk], norths[chunk], zone.number, northern=zone.northern,
+                                             strict=False)
+    return lats, lons
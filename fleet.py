@@ -0,0 +1,138 @@
+import argparse
+import os
+from collections import Counter
+from typing import List, Callable, Union, Sequence, Dict
+
+import numpy as np
+
+from batch import find_inputs, output_paths
+from coordinates import find_zone
+from io_handler import read_route, save_route, save_routes, route_format, EXTENSIONS
+from node_pair import PairGraph, PairSnapper, extend_node_pairs
+from options import SimplifyOptions
+from points import Points
+from route import Route, Lane, FreeLanes, create_route
+from segment import create_segments, GEOMETRY_BACKENDS
+from stats import PipelineStats
+
+FLEET_LAYOUTS = ("stacked", "bands")
+
+
+def create_fleet_pairs(routes: List[Points]) -> PairGraph:
+    """Snap all routes to the same canonical nodes and build a single pair graph. Routes follow each other in
+    graph.order and are not linked with each other."""
+    graph = PairGraph()
+    snapper = PairSnapper()
+    for i, route in enumerate(routes):
+        if i:
+            graph.start_route()
+        extend_node_pairs(graph, route, snapper)
+    return graph
+
+
+def assign_lanes(segments: List[List[Lane]], graph: PairGraph, layout: str = "stacked") -> List[Route]:
+    """Connect lanes of every route of the fleet graph.
+
+    Stacked routes take lanes of a pair from all its lanes, as if they were a single route driven one after another.
+    With bands every route takes lanes from its own range of lanes of a pair, following ranges of the previous routes,
+    so a route keeps its place among the others."""
+    if layout == "stacked":
+        free_lanes = FreeLanes(segments)
+        return [create_route(segments, graph, order, free_lanes) for order in graph.route_orders()]
+    elif layout != "bands":
+        raise Exception(f"Unknown fleet layout {layout}. Available layouts: {', '.join(FLEET_LAYOUTS)}")
+
+    routes = []
+    band_starts: Dict[int, int] = dict()
+    for order in graph.route_orders():
+        bands: Dict[int, List[Lane]] = dict()
+        for pair_id, frequency in Counter(order).items():
+            start = band_starts.get(pair_id, 0)
+            bands[pair_id] = segments[pair_id][start:start + frequency]
+            band_starts[pair_id] = start + frequency
+        routes.append(create_route(bands, graph, order))
+    return routes
+
+
+def simplify_fleet(routes: Sequence[Union[Points, Sequence[Dict[str, float]], Sequence[Sequence[float]]]],
+                   layout: str = "stacked", geometry: str = "numpy", stats: PipelineStats = None,
+                   log: Callable[[str], None] = lambda message: None,
+                   options: SimplifyOptions = None) -> List[Route]:
+    """Simplify many routes together. Routes are snapped to the same canonical nodes and share a single pair graph,
+    so segments of streets driven by many routes are shortened and offsetted once. Returns a route for every input
+    route in the same order."""
+    stats = stats if stats is not None else PipelineStats(trace_allocations=False)
+    routes = [Points.from_latlons(route) for route in routes]
+
+    # All routes are projected into the zone of the median point of the fleet.
+    lats = np.concatenate([route.lat for route in routes]) if routes else np.empty(0)
+    lons = np.concatenate([route.lon for route in routes]) if routes else np.empty(0)
+    zone = find_zone(lats, lons) if len(lats) else None
+    routes = [route if route.zone == zone or len(route) == 0 else Points(route.lat, route.lon, zone=zone)
+              for route in routes]
+    stats.count("routes", len(routes))
+    stats.count("input_points", len(lats))
+    if not routes:
+        return []
+
+    log("Creating node pairs...")
+    with stats.stage("create_node_pairs"):
+        graph = create_fleet_pairs(routes)
+    stats.count("dropped_pairs", graph.dropped_pairs)
+    stats.count("route_pairs", len(graph.order))
+    stats.count("distinct_pairs", len(graph))
+    log(f"Created {len(graph)} distinct pairs of {len(graph.order)} route pairs")
+
+    log("Creating segments...")
+    with stats.stage("create_segments"):
+        segments = create_segments(graph, geometry, options=options)
+    stats.count("lanes", sum(graph.frequencies))
+    log("Segments created")
+
+    log("Simplifying...")
+    with stats.stage("create_route"):
+        simplified_routes = assign_lanes(segments, graph, layout)
+    stats.count("route_parts", sum(len(route.parts) for route in simplified_routes))
+    log("Simplification completed")
+
+    return simplified_routes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simplify many routes together over a shared pair graph.')
+    parser.add_argument('sources', type=str, nargs='+',
+                        help='Directories, glob patterns or manifest files (.txt) with input paths.')
+    parser.add_argument('--output-dir', type=str, default="",
+                        help='Directory for a result of every route. Results are written next to the inputs by '
+                             'default.')
+    parser.add_argument('--format', choices=list(EXTENSIONS), default=".json", help='Extension of the results.')
+    parser.add_argument('--combined', type=str, default="",
+                        help='Save all routes into a single .osm (a way per route) or .json (a list of routes) file '
+                             'instead.')
+    parser.add_argument('--layout', choices=FLEET_LAYOUTS, default="stacked",
+                        help='Stack lanes of all routes together or keep every route in its own band of lanes.')
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="numpy",
+                        help='Geometry backend for shortening and offsetting segments.')
+    parser.add_argument('--no-pretty-print', action='store_true', help='Write OSM output without indentation.')
+
+    args = parser.parse_args()
+
+    if args.combined:
+        route_format(args.combined)
+    inputs = [paths for source in args.sources for paths in find_inputs(source)]
+    paths_to = [] if args.combined else output_paths(inputs, args.output_dir, args.format)
+
+    print(f"Reading {len(inputs)} routes...")
+    simplified_routes = simplify_fleet([read_route(path_from) for path_from, _ in inputs], args.layout, args.geometry,
+                                       log=print)
+
+    if args.combined:
+        save_routes(simplified_routes, args.combined, not args.no_pretty_print)
+        print(f"Routes saved as {args.combined}")
+    else:
+        for (path_from, _), path_to, route in zip(inputs, paths_to, simplified_routes):
+            if os.path.dirname(path_to):
+                os.makedirs(os.path.dirname(path_to), exist_ok=True)
+            save_route(route, path_to, not args.no_pretty_print)
+            print(f"{path_from}: saved as {path_to}")
+    print("Done.")
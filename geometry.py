@@ -0,0 +1,117 @@
+from typing import Tuple, Sequence
+
+import numpy as np
+
+from config import MIN_PAIR_LENGTH
+from node_pair import PairGraph
+from options import SimplifyOptions
+
+# Every pair is a straight two-point line, so shortening and offsetting are closed-form vector operations.
+# All functions work on arrays of pairs (or lanes) at once. Coordinates are (north, east) columns.
+
+
+def pair_vectors(graph: PairGraph, pair_ids: Sequence[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                                                              np.ndarray, np.ndarray]:
+    """Return starts, ends, lengths, unit directions and unit left normals of the pairs (all pairs by default).
+    Rows are aligned with pair ids."""
+    pairs = graph.pairs if pair_ids is None else [graph.pairs[pair_id] for pair_id in pair_ids]
+    starts = np.array([[pair.node_from.utm.north, pair.node_from.utm.east] for pair in pairs]).reshape(-1, 2)
+    ends = np.array([[pair.node_to.utm.north, pair.node_to.utm.east] for pair in pairs]).reshape(-1, 2)
+
+    vectors = ends - starts
+    lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+    directions = vectors / lengths[:, np.newaxis]
+    normals = np.column_stack([-directions[:, 1], directions[:, 0]])
+
+    return starts, ends, lengths, directions, normals
+
+
+def neighbor_edges(graph: PairGraph, side: str, pair_ids: Sequence[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return arrays of pair ids and their neighbor pair ids for all comes_from ('back') or leads_to ('front')
+    links of the pairs (all pairs by default)."""
+    neighbors = graph.comes_from if side == 'back' else graph.leads_to
+    pair_ids = range(len(graph)) if pair_ids is None else pair_ids
+    edge_pair_ids = np.fromiter((pair_id for pair_id in pair_ids for _ in neighbors[pair_id]), dtype=np.int64)
+    neighbor_ids = np.fromiter((neighbor_id for pair_id in pair_ids for neighbor_id in neighbors[pair_id]),
+                               dtype=np.int64)
+    return edge_pair_ids, neighbor_ids
+
+
+def find_cut_distances(graph: PairGraph, options: SimplifyOptions,
+                       pair_ids: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return distances to cut from the back and from the front of every pair to avoid overlaps with offsets of
+    neighbor pairs, indexed by pair id. Distances are memoized on the graph. Only the pairs (all pairs by default)
+    without memoized distances are computed."""
+    offset_distance = options.lane_offset
+    backs, fronts = graph.cut_distances_of(options.cut_distances_key())
+    if pair_ids is None:
+        missing = np.flatnonzero(np.isnan(backs))
+    else:
+        missing = np.unique(pair_ids[np.isnan(backs[pair_ids])])
+    if not len(missing):
+        return backs, fronts
+    graph.cut_distances_misses += len(missing)
+
+    frequencies = np.asarray(graph.frequencies, dtype=np.float64)
+    edges = {side: neighbor_edges(graph, side, missing.tolist()) for side in ('back', 'front')}
+
+    # Vectors are needed only for the missing pairs and their neighbors. Rows of ids are found by searchsorted.
+    ids = np.unique(np.concatenate([missing, edges['back'][1], edges['front'][1]]))
+    starts, ends, lengths, directions, normals = pair_vectors(graph, ids.tolist())
+
+    for side, cut_distances in (('back', backs), ('front', fronts)):
+        pair_ids, neighbor_ids = edges[side]
+        pair_rows = np.searchsorted(ids, pair_ids)
+        neighbor_rows = np.searchsorted(ids, neighbor_ids)
+
+        # Offset the end of a preceding neighbor (or the start of a following one) by its frequency
+        # and project it onto the pair. The projection is clamped to the pair.
+        neighbor_points = (ends if side == 'back' else starts)[neighbor_rows]
+        neighbor_points = neighbor_points + (frequencies[neighbor_ids] * offset_distance)[:, np.newaxis] \
+            * normals[neighbor_rows]
+        projections = np.einsum('ij,ij->i', neighbor_points - starts[pair_rows], directions[pair_rows])
+        projections = np.clip(projections, 0, lengths[pair_rows])
+        distances = projections if side == 'back' else lengths[pair_rows] - projections
+
+        # The farthest neighbor defines the cut. Pairs without neighbors are not cut.
+        farthest = np.full(len(graph), -np.inf)
+        np.maximum.at(farthest, pair_ids, distances)
+        cut_distances[missing] = np.where(np.isfinite(farthest), farthest + options.intersection_offset, 0.0)[missing]
+
+    return backs, fronts
+
+
+def offset_lanes(graph: PairGraph, options: SimplifyOptions, pair_ids: Sequence[int] = None,
+                 lane_multipliers: Sequence[Sequence[int]] = None
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Shorten and offset every lane of the pairs (all pairs by default), or only lanes with the offset multipliers
+    given for every pair. Return pair ids, offset multipliers, starts and ends of lanes. Lanes are ordered by the order
+    of pair ids and by offset multiplier."""
+    ids = np.arange(len(graph)) if pair_ids is None else np.asarray(pair_ids, dtype=np.int64).reshape(-1)
+    starts, ends, lengths, directions, normals = pair_vectors(graph, None if pair_ids is None else ids.tolist())
+    backs, fronts = find_cut_distances(graph, options, None if pair_ids is None else ids)
+
+    if lane_multipliers is None:
+        frequencies = np.asarray(graph.frequencies, dtype=np.int64)[ids]
+        rows = np.repeat(np.arange(len(ids)), frequencies)
+        multipliers = np.arange(len(rows)) - np.repeat(np.cumsum(frequencies) - frequencies, frequencies)
+    else:
+        rows = np.repeat(np.arange(len(ids)), [len(pair_multipliers) for pair_multipliers in lane_multipliers])
+        multipliers = np.fromiter((multiplier for pair_multipliers in lane_multipliers for multiplier in
+                                   pair_multipliers), dtype=np.int64, count=len(rows))
+    pair_ids = ids[rows]
+    lengths = lengths[rows]
+
+    # Shorten lanes in stairs style. The further the lane is - the shorter it is.
+    cut_distances_back = np.minimum(backs[pair_ids] + options.lane_offset_length_reduction * multipliers,
+                                    lengths - MIN_PAIR_LENGTH)
+    cut_distances_front = np.minimum(fronts[pair_ids] + options.lane_offset_length_reduction * multipliers,
+                                     np.maximum(lengths - cut_distances_back - MIN_PAIR_LENGTH, 0))
+
+    # Negative cut distances leave the lane uncut.
+    directions = directions[rows]
+    offsets = ((multipliers + 1) * options.lane_offset)[:, np.newaxis] * normals[rows]
+    lane_starts = starts[rows] + np.maximum(cut_distances_back, 0)[:, np.newaxis] * directions + offsets
+    lane_ends = ends[rows] - np.maximum(cut_distances_front, 0)[:, np.newaxis] * directions + offsets
+
+    return pair_ids, multipliers, lane_starts, lane_ends
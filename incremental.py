@@ -0,0 +1,110 @@
+from typing import List, Union, Sequence, Dict, Optional
+
+import numpy as np
+
+from coordinates import Zone
+from node_pair import PairGraph, PairSnapper, extend_node_pairs
+from options import SimplifyOptions
+from points import Points
+from route import Route, RoutePart, Lane, connect_route
+from segment import create_segments
+
+
+class RouteDiff:
+    """RouteDiff is a change of a route. All parts of the route from the index start are replaced with parts."""
+
+    def __init__(self, start: int, parts: List[RoutePart]):
+        self.start = start
+        self.parts = parts
+
+    def __str__(self):
+        return f"RouteDiff(start: {self.start}, parts: {len(self.parts)})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def apply(self, route: Route):
+        route.parts[self.start:] = self.parts
+
+
+class IncrementalSimplifier:
+    """IncrementalSimplifier simplifies a growing route. Appended points update frequencies and links of the pair
+    graph in place. Only lanes of pairs whose frequency or neighbors changed are created again, and lanes are
+    connected again from the first position of the route passing an affected pair.
+
+    The route is the same as simplify() returns for all points projected into the same zone. The zone is the zone
+    of the first appended points unless it is given."""
+
+    def __init__(self, geometry: str = "numpy", zone: Zone = None, options: SimplifyOptions = None):
+        self.geometry = geometry
+        self.zone = zone
+        self.options = options if options is not None else SimplifyOptions()
+        self.graph = PairGraph()
+        self.snapper = PairSnapper()
+        self.last_point: Optional[Points] = None  # The next appended points continue the route from this point
+
+        self.segments: List[List[Lane]] = []  # Lanes of every pair indexed by pair id
+        self.lanes: List[Lane] = []  # Lane used at every position of graph.order
+        self.route_parts: List[RoutePart] = []
+
+    def __str__(self):
+        return f"IncrementalSimplifier(graph: {self.graph}, route parts: {len(self.route_parts)})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def route(self) -> Route:
+        return Route(list(self.route_parts))
+
+    def append(self, points: Union[Points, Sequence[Dict[str, float]], Sequence[Sequence[float]]]) -> RouteDiff:
+        """Append points to the route and return the change of the simplified route."""
+        points = Points.from_latlons(points)
+        if len(points) == 0:
+            return RouteDiff(len(self.route_parts), [])
+
+        # All points of the route are projected into the same zone.
+        if self.zone is None:
+            self.zone = points.zone
+        elif points.zone != self.zone:
+            points = Points(points.lat, points.lon, zone=self.zone)
+
+        # The first pair of the appended points starts at the last point of the route.
+        if self.last_point is not None:
+            points = Points(np.concatenate([self.last_point.lat, points.lat]),
+                            np.concatenate([self.last_point.lon, points.lon]),
+                            np.concatenate([self.last_point.north, points.north]),
+                            np.concatenate([self.last_point.east, points.east]), self.zone)
+        self.last_point = points[-1:]
+
+        graph = self.graph
+        length = len(graph.order)
+        distinct_pairs = len(graph)
+        if extend_node_pairs(graph, points, self.snapper) == 0:
+            return RouteDiff(len(self.route_parts), [])
+
+        # Appended pairs changed their frequencies and the last pair of the route got a new neighbor.
+        # Cut distances of a pair depend on frequencies of its neighbors, so neighbors of appended pairs change too.
+        appended = set(graph.order[length:])
+        affected = appended | set(graph.order[max(length - 1, 0):length])
+        for pair_id in appended:
+            affected |= graph.comes_from[pair_id] | graph.leads_to[pair_id]
+        affected = sorted(affected)
+
+        graph.invalidate_cut_distances(affected)
+        self.segments.extend([] for _ in range(len(graph) - distinct_pairs))
+        for pair_id, lanes in zip(affected, create_segments(graph, self.geometry, affected, self.options)):
+            self.segments[pair_id] = lanes
+
+        # Positions before the first affected one keep their lanes and route parts.
+        # Lanes at the following positions are released and connected again.
+        first_position = min(graph.first_positions[pair_id] for pair_id in affected)
+        start = max(first_position - 1, 0)
+        for lane in self.lanes[first_position:]:
+            lane.used = False
+        del self.lanes[first_position:]
+        del self.route_parts[2 * start:]
+
+        connect_route(self.segments, graph, self.route_parts, self.lanes, start)
+
+        return RouteDiff(2 * start, self.route_parts[2 * start:])
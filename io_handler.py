@@ -1,84 +1,428 @@
+import bz2
+import gzip
+import io
 import json
-from typing import List, Dict, Tuple
-import xml.etree.ElementTree as xml
+from array import array
+from typing import List, Tuple, IO, Iterator, Union, Callable, Iterable, Dict
 
+import numpy as np
 from lxml import etree
 
-from node import LatLon, Node
-from route import Route
+from points import Points
+from route import Route, RoutePart
+from segment import Segment
 
 
-def get_xml_tree(source: str) -> xml:
-    return xml.fromstring(source)
+COMPRESSIONS = {".gz": gzip.open, ".bz2": bz2.open}
 
+# Binary columnar route format. A 16 byte header is followed by a float64 latitude column, a float64 longitude column
+# and an optional int64 column of pair ids (-1 for connections). All values are little-endian.
+BINARY_HEADER = np.dtype([("magic", "S4"), ("version", "<u2"), ("flags", "<u2"), ("count", "<u8")])
+BINARY_MAGIC = b"RSB1"
+BINARY_VERSION = 1
+BINARY_PAIR_IDS = 1  # Flag of the pair ids column
 
-def find_osm_nodes(source: str) -> Dict[int, Node]:
-    tree = get_xml_tree(source)
 
-    nodes = dict()
-    for element in tree:
-        # Nodes
+def open_route_file(path: str, mode: str = "rb") -> IO:
+    # Compressed files are recognized by their extension.
+    for extension, open_compressed in COMPRESSIONS.items():
+        if path.lower().endswith(extension):
+            return open_compressed(path, mode)
+    return open(path, mode)
+
+
+def strip_compression_extension(path: str) -> str:
+    for extension in COMPRESSIONS:
+        if path.lower().endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def iterparse_osm(source: IO) -> Iterator[Tuple[str, Union[Tuple[int, float, float], List[int]]]]:
+    """Stream an OSM file. Yields ("node", (id, lat, lon)) for every node and ("way", refs) for every way.
+    Parsed elements are cleared, so memory does not grow with the size of the file."""
+    for _, element in etree.iterparse(source, events=("end",), tag=("node", "way")):
         if element.tag == "node":
-            nodes[int(element.attrib["id"])] = Node(latlon=LatLon(lat=float(element.attrib["lat"]),
-                                                                  lon=float(element.attrib["lon"])))
+            yield "node", (int(element.get("id")), float(element.get("lat")), float(element.get("lon")))
+        else:
+            yield "way", [int(nd.get("ref")) for nd in element.iter("nd")]
 
-    return nodes
+        # Free the element and the already processed siblings.
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
 
 
-def read_route_osm(path: str) -> List[Node]:
-    with open(path, 'r') as f:
-        source = f.read()
+def read_route_osm(path: str) -> Points:
+    with open_route_file(path) as f:
+        return parse_route_osm(f, path)
 
-    nodes = find_osm_nodes(source)
 
-    nodes_list: List[Node] = [nodes[-i-1] for i in range(len(nodes))]
-    return nodes_list
+def parse_route_osm(source: IO, name: str = "the route") -> Points:
+    ids, lats, lons = array("q"), array("d"), array("d")
+    refs = None
+    for tag, value in iterparse_osm(source):
+        if tag == "node":
+            node_id, lat, lon = value
+            ids.append(node_id)
+            lats.append(lat)
+            lons.append(lon)
+        elif refs is None:
+            # The first way defines the order of the route.
+            refs = value
 
+    ids = np.frombuffer(ids, dtype=np.int64) if ids else np.empty(0, dtype=np.int64)
+    lats = np.frombuffer(lats, dtype=np.float64) if lats else np.empty(0)
+    lons = np.frombuffer(lons, dtype=np.float64) if lons else np.empty(0)
 
-def read_route_json(path: str) -> List[Node]:
-    with open(path) as f:
-        route = json.load(f)
+    if refs:
+        # Nodes in the order of the way. A way can reference a node multiple times.
+        sorter = np.argsort(ids, kind="stable")
+        positions = np.searchsorted(ids, refs, sorter=sorter).clip(max=max(len(ids) - 1, 0))
+        order = sorter[positions] if len(ids) else positions
+        missing = len(ids) == 0 or ids[order] != refs
+        if np.any(missing):
+            raise Exception(f"Way references nodes missing in {name}: {np.asarray(refs)[missing][:10].tolist()}")
+    elif len(ids) and ids.max() < 0:
+        # Nodes created in JOSM without a way are ordered by their negative ids: -1, -2, ...
+        order = np.argsort(-ids, kind="stable")
+    else:
+        order = np.arange(len(ids))
 
-    route = [Node(LatLon(node["lat"], node["lon"])) for node in route]
-    return route
+    return Points(lats[order], lons[order])
 
 
-def save_route_osm(route: Route, path: str):
-    root = etree.Element("osm", version="0.6", generator="JOSM")  # Header of the main route file
+def read_route_json(path: str) -> Points:
+    with open_route_file(path, "rt") as f:
+        return parse_route_json(f)
+
+
+def parse_route_json(source: IO) -> Points:
+    route = json.load(source)
+    return Points([node["lat"] for node in route], [node["lon"] for node in route])
+
+
+def iterparse_json(source: IO, block_size: int = 2 ** 20) -> Iterator[Dict]:
+    """Stream the objects of a JSON list. Objects are decoded one by one from blocks of the file, so memory does not
+    grow with the size of the file."""
+    decoder = json.JSONDecoder()
+    buffer, position, read_all = "", 0, False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, read_all
+        block = source.read(block_size)
+        buffer, position, read_all = buffer[position:] + block, 0, not block
+        return bool(block)
+
+    def skip(characters: str):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+            if position < len(buffer) or not read_more():
+                return
+
+    skip(" \t\r\n")
+    if buffer[position:position + 1] != "[":
+        raise Exception("JSON route should be a list")
+    position += 1
+    while True:
+        skip(" \t\r\n,")
+        if position == len(buffer):
+            raise Exception("JSON route list is not closed")
+        if buffer[position] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The object continues in the next block.
+            if read_all or not read_more():
+                raise
+            continue
+        yield value
+        position = end
+
+
+def read_route_chunks(path: str, chunk_size: int = 65536) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Stream latitudes and longitudes of a route in chunks of chunk_size points. JSON files are parsed and binary
+    files are memory-mapped chunk by chunk. OSM files can not be streamed, their way follows all nodes."""
+    input_format = route_format(path, compressed=True)
+    if input_format == "binary":
+        # Only the rows of a chunk are mapped at once, mapped pages of the whole file would count to its memory.
+        count = read_binary_count(path)
+        for start in range(0, count, chunk_size):
+            rows = min(chunk_size, count - start)
+            yield tuple(np.array(np.memmap(path, dtype="<f8", mode="r", shape=(rows,),
+                                           offset=BINARY_HEADER.itemsize + 8 * (column * count + start)))
+                        for column in range(2))
+    elif input_format == "json":
+        with open_route_file(path, "rt") as f:
+            lats, lons = array("d"), array("d")
+            for node in iterparse_json(f):
+                lats.append(node["lat"])
+                lons.append(node["lon"])
+                if len(lats) == chunk_size:
+                    yield np.frombuffer(lats, dtype=np.float64), np.frombuffer(lons, dtype=np.float64)
+                    lats, lons = array("d"), array("d")
+            if lats:
+                yield np.frombuffer(lats, dtype=np.float64), np.frombuffer(lons, dtype=np.float64)
+    else:
+        raise Exception(f"Routes can be streamed only from json or binary files, not {input_format}. "
+                        f"Convert {path} to .rsb first")
+
+
+def read_binary_count(path: str) -> int:
+    # Check the header of a binary route file and return its number of points.
+    header = np.fromfile(path, dtype=BINARY_HEADER, count=1)
+    if len(header) == 0 or header["magic"][0] != BINARY_MAGIC:
+        raise Exception(f"{path} is not a binary route file")
+    if header["version"][0] != BINARY_VERSION:
+        raise Exception(f"Unsupported binary route version {header['version'][0]} in {path}")
+    return int(header["count"][0])
+
+
+def read_route_binary(path: str) -> Points:
+    # Columns are memory-mapped, nothing is parsed.
+    count = read_binary_count(path)
+    if count == 0:
+        return Points(np.empty(0), np.empty(0))
+    columns = np.memmap(path, dtype="<f8", mode="r", offset=BINARY_HEADER.itemsize, shape=(2, count))
+    return Points(columns[0], columns[1])
+
+
+def read_route_binary_pair_ids(path: str) -> np.ndarray:
+    header = np.fromfile(path, dtype=BINARY_HEADER, count=1)
+    if len(header) == 0 or not header["flags"][0] & BINARY_PAIR_IDS:
+        raise Exception(f"{path} has no pair ids column")
+
+    count = int(header["count"][0])
+    return np.memmap(path, dtype="<i8", mode="r", offset=BINARY_HEADER.itemsize + 2 * 8 * count, shape=(count,))
+
+
+def write_binary(path: str, count: int, chunks: Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+                 pair_ids: bool = False):
+    # Columns are filled chunk by chunk through a memory map of the output file.
+    header = np.array([(BINARY_MAGIC, BINARY_VERSION, BINARY_PAIR_IDS if pair_ids else 0, count)], dtype=BINARY_HEADER)
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.truncate(BINARY_HEADER.itemsize + (3 if pair_ids else 2) * 8 * count)
+    if count == 0:
+        return
+
+    lats = np.memmap(path, dtype="<f8", mode="r+", offset=BINARY_HEADER.itemsize, shape=(count,))
+    lons = np.memmap(path, dtype="<f8", mode="r+", offset=BINARY_HEADER.itemsize + 8 * count, shape=(count,))
+    ids = np.memmap(path, dtype="<i8", mode="r+", offset=BINARY_HEADER.itemsize + 16 * count,
+                    shape=(count,)) if pair_ids else None
+
+    start = 0
+    for chunk_lats, chunk_lons, chunk_ids in chunks:
+        end = start + len(chunk_lats)
+        lats[start:end] = chunk_lats
+        lons[start:end] = chunk_lons
+        if pair_ids:
+            ids[start:end] = chunk_ids
+        start = end
+
+    for column in (lats, lons, ids):
+        if column is not None:
+            column.flush()
+
+
+def save_points_binary(points: Points, path: str, chunk_size: int = 65536):
+    write_binary(path, len(points), ((points.lat[i:i + chunk_size], points.lon[i:i + chunk_size], None)
+                                     for i in range(0, len(points), chunk_size)))
+
+
+def save_route_binary(route: Route, path: str, pair_ids: bool = False, chunk_size: int = 65536):
+    def chunks():
+        lats, lons, ids = [], [], []
+        for route_part in route.parts:
+            pair_id = route_part.pair.id if isinstance(route_part, Segment) else -1
+            for node in route_part.nodes:
+                lats.append(node.latlon.lat)
+                lons.append(node.latlon.lon)
+                ids.append(pair_id)
+            if len(lats) >= chunk_size:
+                yield lats, lons, ids
+                lats, lons, ids = [], [], []
+        if lats:
+            yield lats, lons, ids
+
+    write_binary(path, sum(len(route_part.nodes) for route_part in route.parts), chunks(), pair_ids)
 
-    # Create nodes.
-    node_counter = -1
-    for route_part in route.parts:
-        for node in route_part.nodes:
-            osm_node = etree.Element("node", id=str(node_counter),
-                                     lon=str(node.latlon.lon),
-                                     lat=str(node.latlon.lat))
-            # Add restaurant tag to show it on the map.
-            osm_node.append(etree.Element("tag", k="amenity", v="restaurant"))
-            root.append(osm_node)
-            node_counter -= 1
-
-    # Create a single way connecting all nodes.
-    way = etree.Element("way", id=str(node_counter))
-    for i in range(-1, node_counter, -1):
-        way.append(etree.Element("nd", ref=str(i)))
-    root.append(way)
-
-    # Add OSM header and save route.
-    source = "<?xml version='1.0' encoding='UTF-8'?>\n" + etree.tostring(root, pretty_print=True).decode('utf-8')
-    with open(path, "w") as f:
-        f.write(source)
 
+def save_route_osm(route: Route, path: str, pretty_print: bool = True):
+    save_routes_osm([route], path, pretty_print)
 
-def save_route_json(route: Route, path: str):
-    route_json: List[Dict[str, float]] = []
 
-    for route_part in route.parts:
+def save_routes_osm(routes: List[Route], path: str, pretty_print: bool = True):
+    with open(path, "wb") as f:
+        write_routes_osm(routes, f, pretty_print)
+
+
+def write_routes_osm(routes: List[Route], f: IO, pretty_print: bool = True):
+    write_route_parts_osm((route.parts for route in routes), f, pretty_print)
+
+
+def write_route_parts_osm(routes: Iterable[Iterable[RoutePart]], f: IO, pretty_print: bool = True):
+    # Nodes are written as the route parts are iterated, so the whole tree is never held in memory.
+    # Route parts can be produced while they are written. The output is the same as serializing the whole tree
+    # with etree.tostring.
+    newline, indent = ("\n", "  ") if pretty_print else ("", "")
+
+    with etree.xmlfile(f, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        with xf.element("osm", version="0.6", generator="JOSM"):  # Header of the main route file
+            # Create nodes. Ids of the first and the next after the last node of every route are kept for its way.
+            node_counter = -1
+            node_ranges = []
+            for route_parts in routes:
+                first_node_id = node_counter
+                for route_part in route_parts:
+                    for node in route_part.nodes:
+                        osm_node = etree.Element("node", id=str(node_counter),
+                                                 lon=str(node.latlon.lon),
+                                                 lat=str(node.latlon.lat))
+                        # Add restaurant tag to show it on the map.
+                        osm_node.append(etree.Element("tag", k="amenity", v="restaurant"))
+                        if pretty_print:
+                            etree.indent(osm_node, space=indent, level=1)
+                        xf.write(newline + indent, osm_node)
+                        node_counter -= 1
+                node_ranges.append((first_node_id, node_counter))
+
+            # Create a way connecting all nodes of every route.
+            for first_node_id, end_node_id in node_ranges:
+                xf.write(newline + indent)
+                if first_node_id == end_node_id:
+                    xf.write(etree.Element("way", id=str(node_counter)))
+                else:
+                    with xf.element("way", id=str(node_counter)):
+                        for i in range(first_node_id, end_node_id, -1):
+                            xf.write(newline + indent * 2, etree.Element("nd", ref=str(i)))
+                        xf.write(newline + indent)
+                node_counter -= 1
+            xf.write(newline)
+    f.write(newline.encode("utf-8"))
+
+
+def encode_route_json(route: Route, write: Callable[[str], None], chunk_size: int = 4096):
+    encode_route_parts_json(route.parts, write, chunk_size)
+
+
+def encode_route_parts_json(route_parts: Iterable[RoutePart], write: Callable[[str], None], chunk_size: int = 4096):
+    # Nodes are encoded in chunks as the route parts are iterated. The output is the same as json.dumps of a list.
+    encoder = json.JSONEncoder()
+    separator = ""
+    chunk: List[str] = []
+
+    write("[")
+    for route_part in route_parts:
         for node in route_part.nodes:
-            route_json.append({
+            chunk.append(encoder.encode({
                 "lat": node.latlon.lat,
                 "lon": node.latlon.lon
-            })
+            }))
+            if len(chunk) == chunk_size:
+                write(separator + ", ".join(chunk))
+                separator = ", "
+                chunk = []
+    if chunk:
+        write(separator + ", ".join(chunk))
+    write("]")
+
+
+def save_route_json(route: Route, path: str, chunk_size: int = 4096):
+    with open(path, "w") as f:
+        encode_route_json(route, f.write, chunk_size)
+
 
+def save_routes_json(routes: List[Route], path: str, chunk_size: int = 4096):
+    # A list of routes, every route is a list of nodes.
     with open(path, "w") as f:
-        json.dump(route_json, f)
+        f.write("[")
+        for i, route in enumerate(routes):
+            f.write(", " if i else "")
+            encode_route_json(route, f.write, chunk_size)
+        f.write("]")
+
+
+READERS = {"json": read_route_json, "osm": read_route_osm, "binary": read_route_binary}
+EXTENSIONS = {".json": "json", ".osm": "osm", ".rsb": "binary"}
+
+
+def route_format(path: str, compressed: bool = False) -> str:
+    """Find the format of a route file by its extension. JSON and OSM files can be compressed if allowed."""
+    stripped_path = strip_compression_extension(path) if compressed else path
+    for extension, format_name in EXTENSIONS.items():
+        if stripped_path.lower().endswith(extension) and (stripped_path == path or format_name != "binary"):
+            return format_name
+
+    raise Exception(f"File extension of {path} should be one of {', '.join(EXTENSIONS)}"
+                    + (f" optionally followed by {', '.join(COMPRESSIONS)}" if compressed else ""))
+
+
+def read_route(path: str) -> Points:
+    return READERS[route_format(path, compressed=True)](path)
+
+
+def save_routes(routes: List[Route], path: str, pretty_print: bool = True):
+    """Save many routes into a single file. OSM files get a way per route, JSON files a list of routes."""
+    output_format = route_format(path)
+    if output_format == "json":
+        save_routes_json(routes, path)
+    elif output_format == "osm":
+        save_routes_osm(routes, path, pretty_print)
+    else:
+        raise Exception(f"Many routes can not be saved into a single {output_format} file. Use .json or .osm")
+
+
+def save_route(route: Route, path: str, pretty_print: bool = True):
+    output_format = route_format(path)
+    if output_format == "json":
+        save_route_json(route, path)
+    elif output_format == "osm":
+        save_route_osm(route, path, pretty_print)
+    else:
+        save_route_binary(route, path)
+
+
+def save_route_parts(route_parts: Iterable[RoutePart], path: str, pretty_print: bool = True):
+    """Save route parts while they are produced, the same way as save_route saves a route of them."""
+    output_format = route_format(path)
+    if output_format == "json":
+        with open(path, "w") as f:
+            encode_route_parts_json(route_parts, f.write)
+    elif output_format == "osm":
+        with open(path, "wb") as f:
+            write_route_parts_osm([route_parts], f, pretty_print)
+    else:
+        raise Exception(f"Route parts can not be streamed into a {output_format} file. Use .json or .osm")
+
+
+def parse_route(data: bytes, input_format: str) -> Points:
+    """Parse a route held in memory. JSON and OSM routes can be compressed with gzip or bzip2."""
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    elif data[:3] == b"BZh":
+        data = bz2.decompress(data)
+
+    if input_format == "json":
+        return parse_route_json(io.BytesIO(data))
+    elif input_format == "osm":
+        return parse_route_osm(io.BytesIO(data))
+    raise Exception(f"Routes held in memory can be parsed only from json or osm, not {input_format}")
+
+
+def encode_route(route: Route, output_format: str, pretty_print: bool = True) -> bytes:
+    """Encode a route in memory the same way as it is saved to a file of the format."""
+    if output_format == "json":
+        output = io.StringIO()
+        encode_route_json(route, output.write)
+        return output.getvalue().encode("utf-8")
+    elif output_format == "osm":
+        output = io.BytesIO()
+        write_routes_osm([route], output, pretty_print)
+        return output.getvalue()
+    raise Exception(f"Routes can be encoded in memory only as json or osm, not {output_format}")
@@ -1,39 +1,41 @@
 import math
 
-from utm import to_latlon, from_latlon, latlon_to_zone_number, latitude_to_zone_letter
-
 from config import NODES_POSITION_ERROR
+from coordinates import Zone, find_zone, latlon_to_utm, utm_to_latlon
 
 
 class LatLon:
     """LatLon coordinates are a pair of latitude and longitude."""
 
+    __slots__ = ("lat", "lon")
+
     def __init__(self, lat: float, lon: float):
         self.lat = lat
         self.lon = lon
 
-    def convert_to_utm(self):
-        northeast = from_latlon(self.lat, self.lon)
-        north = northeast[1]
-        east = northeast[0]
-        return UTM(north, east)
+    def convert_to_utm(self, zone: Zone = None):
+        if zone is None:
+            zone = find_zone([self.lat], [self.lon])
+        norths, easts, zone = latlon_to_utm([self.lat], [self.lon], zone)
+        return UTM(float(norths[0]), float(easts[0]), zone)
 
     def __hash__(self):
         return hash(f"{self.lat}{self.lon}")
 
 
 class UTM:
-    """UTM coordinates are a pair of north and east. They are used for geometrical operations."""
+    """UTM coordinates are a pair of north and east within a zone. They are used for geometrical operations."""
+
+    __slots__ = ("north", "east", "zone")
 
-    def __init__(self, north: float, east: float):
+    def __init__(self, north: float, east: float, zone: Zone):
         self.north = north
         self.east = east
+        self.zone = zone
 
-    def convert_to_latlon(self, zone: LatLon):
-        zone_number = latlon_to_zone_number(zone.lat, zone.lon)
-        zone_letter = latitude_to_zone_letter(zone.lat)
-        lat, lon = to_latlon(self.east, self.north, zone_number, zone_letter)
-        return LatLon(lat, lon)
+    def convert_to_latlon(self):
+        lats, lons = utm_to_latlon([self.north], [self.east], self.zone)
+        return LatLon(float(lats[0]), float(lons[0]))
 
     def __sub__(self, other):
         return math.sqrt((self.north - other.north) ** 2 + (self.east - other.east) ** 2)
@@ -42,9 +44,11 @@ class UTM:
 class Node:
     """Node is a point of a route."""
 
-    def __init__(self, latlon: LatLon):
+    __slots__ = ("latlon", "utm")
+
+    def __init__(self, latlon: LatLon, utm: UTM = None):
         self.latlon = latlon
-        self.utm = latlon.convert_to_utm()
+        self.utm = latlon.convert_to_utm() if utm is None else utm
 
     def __str__(self):
         return f"Node(lat: {self.latlon.lat}, lon: {self.latlon.lon})"
@@ -54,3 +58,4 @@ class Node:
 
     def __eq__(self, other):
         return isinstance(other, Node) and self.utm - other.utm < NODES_POSITION_ERROR
+
@@ -1,24 +1,24 @@
-import copy
-import math
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Set, Optional, Iterable, Hashable
+
+import numpy as np
 
 from config import MIN_PAIR_LENGTH
 from node import Node
+from points import Points
+from snapping import NodeSnapper
 
 
 class NodePair:
-    """NodePair is a pair of nodes longer than MIN_PAIR_LENGTH with references to neighbor pairs."""
+    """NodePair is a pair of nodes longer than MIN_PAIR_LENGTH. Its id is assigned by a PairGraph."""
 
     def __init__(self, node_from: Node, node_to: Node):
         self.node_from = node_from
         self.node_to = node_to
 
-        self.comes_from = set()
-        self.leads_to = set()
+        self.id: Optional[int] = None
 
     def __str__(self):
-        return f"NodePair(from: {self.node_from}, to: {self.node_to}, " \
-               f"comes_from: {len(self.comes_from)}, leads_to: {len(self.leads_to)})"
+        return f"NodePair(id: {self.id}, from: {self.node_from}, to: {self.node_to})"
 
     def __repr__(self):
         return self.__str__()
@@ -31,48 +31,176 @@ class NodePair:
                and self.node_to == other.node_to
 
 
-def create_node_pairs(route: List[Node]) -> Tuple[Dict[NodePair, int], List[NodePair]]:
-    # Create all pairs and save them in the original order
-    pairs_order: List[NodePair] = []
+class PairGraph:
+    """PairGraph is a graph with NodePairs as its vertices. Pairs are referenced by integer ids, which are
+    indices into pairs, frequencies, comes_from and leads_to. order keeps pair ids in the original route order."""
+
+    def __init__(self):
+        self.pairs: List[NodePair] = []
+        self.frequencies: List[int] = []
+        self.comes_from: List[Set[int]] = []
+        self.leads_to: List[Set[int]] = []
+        self.order: List[int] = []
+        self.first_positions: List[int] = []  # Position of the first occurrence of every pair in order
+        self.route_starts: List[int] = [0]  # Positions in order where routes start. Routes are not linked
+
+        # Cut distances (back, front) of pairs memoized by segments. Keyed by the offset settings they depend on,
+        # indexed by pair id.
+        self.cut_distances: Dict[Hashable, Tuple[np.ndarray, np.ndarray]] = dict()
+        self.cut_distances_hits = 0
+        self.cut_distances_misses = 0
+
+        self.dropped_pairs = 0  # Pairs of the route shorter than MIN_PAIR_LENGTH
+        self.shapely_calls = 0  # Shapely geometry operations of the reference segments backend
+
+    def __len__(self):
+        return len(self.pairs)
 
-    for i in range(len(route) - 1):
-        node_from = route[i]
-        node_to = route[i + 1]
+    def __str__(self):
+        return f"PairGraph(pairs: {len(self.pairs)}, order: {len(self.order)})"
 
-        # If a pair is shorter than MIN_PAIR_LENGTH, ignore it.
-        if node_from.latlon == node_to.latlon or math.sqrt(
-                (node_to.utm.north - node_from.utm.north) ** 2 + (
-                        node_to.utm.east - node_from.utm.east) ** 2) < MIN_PAIR_LENGTH:
-            continue
-        pair = NodePair(node_from, node_to)
-        pairs_order.append(pair)
+    def __repr__(self):
+        return self.__str__()
 
-    # Find nodes closer to each other than NODES_POSITION_ERROR and replace them with copies.
-    # Replacing with copies is an easier way of replacing positions.
-    # This is need to be able to hash pairs (positions of close nodes should be the same).
-    for i in range(len(pairs_order) - 1):
-        for j in range(i + 1, len(pairs_order)):
-            if pairs_order[i] == pairs_order[j]:
-                pairs_order[j] = copy.deepcopy(pairs_order[i])
+    def add_pair(self, pair: NodePair) -> int:
+        pair.id = len(self.pairs)
+        self.pairs.append(pair)
+        self.frequencies.append(0)
+        self.comes_from.append(set())
+        self.leads_to.append(set())
+        self.first_positions.append(len(self.order))
+        return pair.id
+
+    def append(self, pair: NodePair):
+        """Append a pair to the end of the route. Count its frequency and link it with the previous pair."""
+        pair_id = self.add_pair(pair) if pair.id is None else pair.id
+        self.frequencies[pair_id] += 1
+
+        if len(self.order) > self.route_starts[-1]:
+            last_pair_id = self.order[-1]
+            self.leads_to[last_pair_id].add(pair_id)
+            self.comes_from[pair_id].add(last_pair_id)
+        self.order.append(pair_id)
+
+    def start_route(self):
+        """Start a new route after the first one. Its first pair is not linked with the last pair of the previous
+        route."""
+        self.route_starts.append(len(self.order))
+
+    def route_orders(self) -> List[List[int]]:
+        bounds = self.route_starts + [len(self.order)]
+        return [self.order[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def cut_distances_of(self, key: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        # NaN marks pairs whose cut distances are not computed yet.
+        # Arrays are grown with NaN if pairs were added to the graph after they were created.
+        backs, fronts = self.cut_distances.get(key, (np.empty(0), np.empty(0)))
+        if len(backs) < len(self):
+            missing = np.full(len(self) - len(backs), np.nan)
+            backs, fronts = np.concatenate([backs, missing]), np.concatenate([fronts, missing])
+            self.cut_distances[key] = (backs, fronts)
+        return backs, fronts
+
+    def invalidate_cut_distances(self, pair_ids: Iterable[int]):
+        """Forget memoized cut distances of the pairs for all offset settings."""
+        pair_ids = np.fromiter(pair_ids, dtype=np.int64)
+        for backs, fronts in self.cut_distances.values():
+            pair_ids_in_range = pair_ids[pair_ids < len(backs)]
+            backs[pair_ids_in_range] = np.nan
+            fronts[pair_ids_in_range] = np.nan
+
+    def cut_distances_hit_rate(self) -> float:
+        lookups = self.cut_distances_hits + self.cut_distances_misses
+        return self.cut_distances_hits / lookups if lookups else 0.0
+
+    def pairs_order(self) -> List[NodePair]:
+        return [self.pairs[pair_id] for pair_id in self.order]
+
+    def to_dict(self) -> Dict:
+        return {
+            "pairs": [{
+                "from": {"lat": pair.node_from.latlon.lat, "lon": pair.node_from.latlon.lon},
+                "to": {"lat": pair.node_to.latlon.lat, "lon": pair.node_to.latlon.lon},
+                "frequency": self.frequencies[pair.id],
+                "comes_from": sorted(self.comes_from[pair.id]),
+                "leads_to": sorted(self.leads_to[pair.id])
+            } for pair in self.pairs],
+            "order": self.order
+        }
+
+
+class PairSnapper:
+    """PairSnapper snaps nodes closer to each other than NODES_POSITION_ERROR to canonical nodes and keys pairs by ids
+    of their canonical nodes, so equal pairs become the same NodePair object. Node objects are created only for
+    canonical nodes. The state is kept between calls, so a route can be snapped in parts."""
+
+    def __init__(self):
+        self.snapper = NodeSnapper()
+        self.nodes: List[Node] = []
+        self.pairs: Dict[Tuple[int, int], NodePair] = dict()
+
+    def snap(self, route: Points, index: int, north: float, east: float) -> int:
+        node_id = self.snapper.snap(north, east)
+        if node_id == len(self.nodes):
+            self.nodes.append(route[index])
+        return node_id
+
+
+def create_node_pairs(route: Points) -> PairGraph:
+    graph = PairGraph()
+    extend_node_pairs(graph, route, PairSnapper())
+    return graph
+
+
+def extend_node_pairs(graph: PairGraph, route: Points, snapper: PairSnapper) -> int:
+    """Append pairs of the route to the graph and return the number of appended pairs. To continue a route,
+    the route has to start with the last point of the previous part and the same snapper has to be used."""
+    pairs_order, dropped_pairs = route_node_pairs(route, snapper)
 
     # Count frequencies of pairs and add references to neighbor links.
-    # Keep in mind, that references are added only to the pairs which serve as dictionary keys.
-    # Not all pairs in the pairs_order list have them.
-    last_pair = None
-    pairs_dict: Dict[NodePair, int] = dict()
+    graph.dropped_pairs += dropped_pairs
     for pair in pairs_order:
-        if pair in pairs_dict:
-            pairs_dict[pair] += 1
-        else:
-            pairs_dict[pair] = 1
-
-        if last_pair:
-            # Added neighbor references to dictionary keys.
-            keys = list(pairs_dict.keys())
-            last_pair_original = keys[keys.index(last_pair)]
-            pair_original = keys[keys.index(pair)]
-            last_pair_original.leads_to.add(pair_original)
-            pair_original.comes_from.add(last_pair_original)
-        last_pair = pair
-
-    return pairs_dict, pairs_order
+        graph.append(pair)
+
+    return len(pairs_order)
+
+
+def route_node_pairs(route: Points, snapper: PairSnapper) -> Tuple[List[NodePair], int]:
+    """Return snapped pairs of the route in order and the number of dropped pairs."""
+    # If a pair is shorter than MIN_PAIR_LENGTH, ignore it.
+    # Pairs are represented by indices of their first points in the original order.
+    lengths = np.hypot(np.diff(route.north), np.diff(route.east))
+    starts = np.flatnonzero(lengths >= MIN_PAIR_LENGTH)
+
+    # Snap nodes closer to each other than NODES_POSITION_ERROR to canonical nodes.
+    # This is need to be able to count pairs (positions of close nodes should be the same).
+    pairs_order = snap_node_pairs(route, starts, snapper=snapper)
+
+    # Short pairs and pairs with both nodes snapped to the same node are dropped.
+    return pairs_order, max(len(route) - 1, 0) - len(pairs_order)
+
+
+def snap_node_pairs(route: Points, starts: np.ndarray, chunk_size: int = 65536,
+                    snapper: PairSnapper = None) -> List[NodePair]:
+    snapper = snapper if snapper is not None else PairSnapper()
+    snapped_pairs_order: List[NodePair] = []
+
+    # Coordinates are converted to Python floats in chunks to keep memory bounded.
+    for chunk_start in range(0, len(starts), chunk_size):
+        chunk = starts[chunk_start:chunk_start + chunk_size]
+        for i, north_from, east_from, north_to, east_to in zip(chunk.tolist(),
+                                                               route.north[chunk].tolist(),
+                                                               route.east[chunk].tolist(),
+                                                               route.north[chunk + 1].tolist(),
+                                                               route.east[chunk + 1].tolist()):
+            key = (snapper.snap(route, i, north_from, east_from), snapper.snap(route, i + 1, north_to, east_to))
+
+            # Both nodes of a pair can be snapped to the same node if NODES_POSITION_ERROR is large.
+            if key[0] == key[1]:
+                continue
+
+            if key not in snapper.pairs:
+                snapper.pairs[key] = NodePair(snapper.nodes[key[0]], snapper.nodes[key[1]])
+            snapped_pairs_order.append(snapper.pairs[key])
+
+    return snapped_pairs_order
@@ -0,0 +1,45 @@
+from typing import Dict, Tuple
+
+from config import LANE_OFFSET, LANE_OFFSET_LENGTH_REDUCTION, INTERSECTION_OFFSET
+
+
+class SimplifyOptions:
+    """SimplifyOptions are the offset settings of a single simplification in meters. Defaults are the values of
+    config.py. Different options can be used in the same process and with the same pair graph."""
+
+    def __init__(self, lane_offset: float = LANE_OFFSET,
+                 lane_offset_length_reduction: float = LANE_OFFSET_LENGTH_REDUCTION,
+                 intersection_offset: float = INTERSECTION_OFFSET):
+        self.lane_offset = lane_offset  # Distance to which each lane is going to be moved
+        self.lane_offset_length_reduction = lane_offset_length_reduction  # Distance reduction of each offsetted lane
+        self.intersection_offset = intersection_offset  # Shorten segment which neighbors an intersection by this length
+
+    def __str__(self):
+        return f"SimplifyOptions(lane offset: {self.lane_offset}, lane offset length reduction: " \
+               f"{self.lane_offset_length_reduction}, intersection offset: {self.intersection_offset})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __eq__(self, other):
+        return isinstance(other, SimplifyOptions) and self.to_config() == other.to_config()
+
+    def __hash__(self):
+        return hash(tuple(self.to_config().values()))
+
+    def scaled(self, factor: float) -> "SimplifyOptions":
+        # All values are distances, so options for another map scale are scaled together.
+        return SimplifyOptions(self.lane_offset * factor, self.lane_offset_length_reduction * factor,
+                               self.intersection_offset * factor)
+
+    def cut_distances_key(self) -> Tuple[float, float]:
+        # Cut distances of pairs depend on the lane offset and the intersection offset only.
+        return self.lane_offset, self.intersection_offset
+
+    def to_config(self) -> Dict[str, float]:
+        # Names of the values in config.py.
+        return {
+            "LANE_OFFSET": self.lane_offset,
+            "LANE_OFFSET_LENGTH_REDUCTION": self.lane_offset_length_reduction,
+            "INTERSECTION_OFFSET": self.intersection_offset
+        }
@@ -0,0 +1,66 @@
+from typing import Sequence, Iterator, Union, Dict
+
+import numpy as np
+
+from coordinates import Zone, latlon_to_utm, utm_to_latlon
+from node import LatLon, UTM, Node
+
+
+class Points:
+    """Points is a compact array-backed sequence of route points. Coordinates are stored in float64 columns.
+    Node objects are created only on access and are views of a single point."""
+
+    __slots__ = ("lat", "lon", "north", "east", "zone")
+
+    def __init__(self, lat: Sequence[float], lon: Sequence[float], north: Sequence[float] = None,
+                 east: Sequence[float] = None, zone: Zone = None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        if north is None or east is None:
+            north, east, zone = latlon_to_utm(self.lat, self.lon, zone)
+        self.north = np.asarray(north, dtype=np.float64)
+        self.east = np.asarray(east, dtype=np.float64)
+        self.zone = zone
+
+    @classmethod
+    def from_utm(cls, north: Sequence[float], east: Sequence[float], zone: Zone) -> "Points":
+        lat, lon = utm_to_latlon(north, east, zone)
+        return cls(lat, lon, north, east, zone)
+
+    @classmethod
+    def from_latlons(cls, latlons: Union["Points", Sequence[Dict[str, float]], Sequence[Sequence[float]]]) -> "Points":
+        """Create points from a sequence of {"lat": ..., "lon": ...} dicts or of (lat, lon) pairs, or from an array of
+        shape (n, 2). Points are returned as they are."""
+        if isinstance(latlons, Points):
+            return latlons
+        if len(latlons) and isinstance(latlons[0], dict):
+            return cls([latlon["lat"] for latlon in latlons], [latlon["lon"] for latlon in latlons])
+
+        latlons = np.asarray(latlons, dtype=np.float64).reshape(-1, 2)
+        return cls(latlons[:, 0], latlons[:, 1])
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __getitem__(self, item: Union[int, slice, np.ndarray]) -> Union[Node, "Points"]:
+        # Slices and arrays of indices return Points.
+        if isinstance(item, (slice, np.ndarray)):
+            return Points(self.lat[item], self.lon[item], self.north[item], self.east[item], self.zone)
+
+        return Node(LatLon(float(self.lat[item]), float(self.lon[item])),
+                    UTM(float(self.north[item]), float(self.east[item]), self.zone))
+
+    def __iter__(self) -> Iterator[Node]:
+        for lat, lon, north, east in zip(self.lat.tolist(), self.lon.tolist(),
+                                         self.north.tolist(), self.east.tolist()):
+            yield Node(LatLon(lat, lon), UTM(north, east, self.zone))
+
+    def __str__(self):
+        return f"Points(length: {len(self)}, zone: {self.zone})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def nbytes(self) -> int:
+        return self.lat.nbytes + self.lon.nbytes + self.north.nbytes + self.east.nbytes
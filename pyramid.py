@@ -0,0 +1,150 @@
+import argparse
+import json
+import math
+import os
+from typing import List, Callable, Union, Sequence, Dict, Iterator, Tuple
+
+import numpy as np
+
+from io_handler import read_route, route_format, strip_compression_extension
+from options import SimplifyOptions
+from points import Points
+from reduction import douglas_peucker
+from route import Route
+from segment import GEOMETRY_BACKENDS
+from stats import PipelineStats
+from sweep import simplify_sweep
+
+ZOOM_LEVELS = (10, 12, 14, 16, 18)
+REFERENCE_ZOOM = 18  # Offsets of the options are meters at this zoom. Other zooms keep the same offsets in pixels
+PIXEL_TOLERANCE = 0.5  # pixels. Nodes moving the route by less are removed
+TILE_PIXELS = 256
+EARTH_CIRCUMFERENCE = 40075016.686  # meters
+METERS_PER_DEGREE = EARTH_CIRCUMFERENCE / 360
+MAX_PRECISION = 7  # Decimal places of encoded coordinates, about a centimeter
+
+
+def meters_per_pixel(zoom: int, lat: float) -> float:
+    # Web Mercator tiles of TILE_PIXELS at the latitude.
+    return EARTH_CIRCUMFERENCE * math.cos(math.radians(lat)) / (TILE_PIXELS * 2 ** zoom)
+
+
+def zoom_precision(tolerance: float) -> int:
+    # The fewest decimal places with a quantization step not larger than the tolerance in meters.
+    return min(max(math.ceil(math.log10(METERS_PER_DEGREE / tolerance)), 0), MAX_PRECISION)
+
+
+def route_polyline(route: Route, tolerance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Return latitudes and longitudes of the nodes of the route reduced with Douglas-Peucker to the tolerance in
+    meters. Ends of the route are kept."""
+    nodes = [node for route_part in route.parts for node in route_part.nodes]
+    lats = np.array([node.latlon.lat for node in nodes])
+    lons = np.array([node.latlon.lon for node in nodes])
+    if len(nodes) < 3:
+        return lats, lons
+
+    kept = np.zeros(len(nodes), dtype=bool)
+    kept[[0, -1]] = True
+    kept = douglas_peucker(np.array([node.utm.north for node in nodes]), np.array([node.utm.east for node in nodes]),
+                           kept, tolerance)
+    return lats[kept], lons[kept]
+
+
+def encode_polyline(lats: np.ndarray, lons: np.ndarray, precision: int = 5) -> str:
+    """Encode coordinates in the encoded polyline format. Coordinates are rounded to precision decimal places,
+    delta-encoded and written as chunks of 5 bits, the least significant first."""
+    values = np.round(np.column_stack([lats, lons]) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).reshape(-1)
+    deltas = (deltas << 1) ^ (deltas >> 63)  # Negative deltas are inverted, the sign is the lowest bit
+
+    # Every chunk except the last one of a value has the continuation bit 0x20. All values have a chunk.
+    shifts = 5 * np.arange(13)
+    rests = deltas[:, np.newaxis] >> shifts
+    chunks = (rests & 0x1f) | np.where(rests >= 0x20, 0x20, 0)
+    present = (rests > 0) | (shifts == 0)
+    return (chunks[present] + 63).astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode_polyline(polyline: str, precision: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    # Reference decoder of encode_polyline.
+    values = []
+    value, shift = 0, 0
+    for code in polyline.encode("ascii"):
+        value |= ((code - 63) & 0x1f) << shift
+        shift += 5
+        if code - 63 < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    coordinates = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def create_pyramid(points: Union[Points, Sequence[Dict[str, float]], Sequence[Sequence[float]]],
+                   zooms: Sequence[int] = ZOOM_LEVELS, options: SimplifyOptions = None,
+                   pixel_tolerance: float = PIXEL_TOLERANCE, geometry: str = "numpy", stats: PipelineStats = None,
+                   log: Callable[[str], None] = lambda message: None) -> Iterator[Dict]:
+    """Simplify a route for every zoom level. Offsets of the options are scaled from REFERENCE_ZOOM to every zoom,
+    so lanes are equally far apart on the screen, and the pair graph is built once for all levels. Nodes of every
+    level are reduced to the pixel tolerance and encoded as a polyline with the precision of the level."""
+    points = Points.from_latlons(points)
+    options = options if options is not None else SimplifyOptions()
+    lat = float(np.median(points.lat)) if len(points) else 0.0
+    zooms = sorted(zooms)
+
+    level_options = [options.scaled(2 ** (REFERENCE_ZOOM - zoom)) for zoom in zooms]
+    for zoom, (level_option, route) in zip(zooms, simplify_sweep(points, level_options, geometry, stats, log)):
+        tolerance = pixel_tolerance * meters_per_pixel(zoom, lat)
+        lats, lons = route_polyline(route, tolerance)
+        precision = zoom_precision(tolerance)
+        yield {
+            "zoom": zoom,
+            "tolerance": tolerance,
+            "lane_offset": level_option.lane_offset,
+            "precision": precision,
+            "points": len(lats),
+            "polyline": encode_polyline(lats, lons, precision)
+        }
+
+
+def save_pyramid(levels: Iterator[Dict], output_dir: str, name: str) -> List[Dict]:
+    """Save every level as name.z<zoom>.json and an index of the levels as name.index.json, so a client fetches
+    the index and the level it needs only. Returns the index."""
+    os.makedirs(output_dir, exist_ok=True)
+    index = []
+    for level in levels:
+        file_name = f"{name}.z{level['zoom']}.json"
+        with open(os.path.join(output_dir, file_name), "w") as f:
+            json.dump(level, f)
+        index.append({**{key: value for key, value in level.items() if key != "polyline"}, "file": file_name,
+                      "bytes": os.path.getsize(os.path.join(output_dir, file_name))})
+
+    with open(os.path.join(output_dir, f"{name}.index.json"), "w") as f:
+        json.dump({"reference_zoom": REFERENCE_ZOOM, "levels": index}, f, indent=2)
+    return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simplify a route for every zoom level of a web map.')
+    parser.add_argument('input_path', type=str, help='Path to the input file.')
+    parser.add_argument('output_dir', type=str, help='Directory for the levels and their index.')
+    parser.add_argument('--zooms', type=int, nargs='+', default=list(ZOOM_LEVELS), help='Zoom levels.')
+    parser.add_argument('--pixel-tolerance', type=float, default=PIXEL_TOLERANCE,
+                        help='Pixels by which nodes of a level can move.')
+    parser.add_argument('--lane-offset', type=float, default=SimplifyOptions().lane_offset,
+                        help=f'Distance between lanes in meters at zoom {REFERENCE_ZOOM}.')
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="numpy",
+                        help='Geometry backend for shortening and offsetting segments.')
+
+    args = parser.parse_args()
+
+    route_format(args.input_path, compressed=True)
+    name = os.path.basename(strip_compression_extension(args.input_path))
+    name = name[:-len(os.path.splitext(name)[1])]
+
+    print("Reading the input route...")
+    original_route = read_route(args.input_path)
+    options = SimplifyOptions(lane_offset=args.lane_offset)
+    levels = create_pyramid(original_route, args.zooms, options, args.pixel_tolerance, args.geometry, log=print)
+    for level in save_pyramid(levels, args.output_dir, name):
+        print(f"Zoom {level['zoom']}: {level['points']} points, {level['bytes']} bytes saved as {level['file']}")
+    print("Done.")
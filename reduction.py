@@ -0,0 +1,187 @@
+import math
+from typing import Tuple, List
+
+import numpy as np
+
+from config import NODES_POSITION_ERROR, MIN_PAIR_LENGTH
+from points import Points
+from snapping import NodeSnapper
+
+TURN_ANGLE = 30  # degrees. Points where the heading changes by more than TURN_ANGLE are turns
+REVISIT_RADIUS = 2  # Points closer than REVISIT_RADIUS snap radii to another pass of the route are snapped
+REVISIT_ARC_LENGTH = 8  # Close points further apart than REVISIT_ARC_LENGTH snap radii belong to different passes
+
+
+def reduce_points(points: Points, tolerance: float) -> Tuple[Points, int, int]:
+    """Remove points that move the route by less than tolerance meters before node pairs are created.
+    Stationary clusters are collapsed to their first point, then the rest is reduced with Douglas-Peucker.
+    Points close to another pass of the route are snapped to nodes like in create_node_pairs, within the tolerance
+    if it is larger than NODES_POSITION_ERROR. A node is kept or removed on every pass through it, so a street driven
+    more than once is reduced the same way on every pass and keeps its pairs and frequencies. Kept points of a node
+    are moved to its first point. Turns and nodes where the route enters or leaves a street are always kept.
+    Returns the reduced points and the numbers of collapsed and removed points."""
+    if len(points) < 3 or tolerance <= 0:
+        return points, 0, 0
+
+    radius = max(tolerance, NODES_POSITION_ERROR)
+    indices = np.arange(len(points))
+    representatives = collapse_stationary(points.north, points.east, tolerance)
+    collapsed = np.flatnonzero(representatives == indices)
+
+    # Points of a stationary cluster share the position of the cluster along the route, so standing still does not
+    # look like another pass. A cluster with a revisited point is not collapsed, its points are snapped instead.
+    arcs = np.empty(len(points))
+    arcs[collapsed] = route_arc(points.north[collapsed], points.east[collapsed])
+    revisited = revisited_points(points.north, points.east, arcs[representatives], radius)
+    revisited = (np.bincount(representatives, weights=revisited, minlength=len(points)) > 0)[representatives]
+
+    survivors = np.flatnonzero((representatives == indices) | revisited)
+    north, east = points.north[survivors], points.east[survivors]
+    nodes = snap_nodes(north, east, revisited[survivors], radius)
+
+    # Consecutive points of the same node are a single visit of the node.
+    visits = nodes[np.flatnonzero(np.diff(nodes, prepend=-1))]
+    north, east = north[visits], east[visits]
+
+    protected = np.zeros(len(survivors), dtype=bool)  # Indexed by nodes
+    protected[visits[turn_points(north, east, route_arc(north, east), tolerance)]] = True
+    protected[visits[[0, -1]]] = True
+    protected |= junction_nodes(visits, len(survivors))
+
+    kept = np.zeros(len(survivors), dtype=bool)
+    kept[visits[douglas_peucker(north, east, protected[visits], tolerance)]] = True
+    reduced = visits[kept[visits]]
+    reduced = reduced[np.flatnonzero(np.diff(reduced, prepend=-1))]
+    return points[survivors[reduced]], len(points) - len(visits), len(visits) - len(reduced)
+
+
+def snap_nodes(north: np.ndarray, east: np.ndarray, revisited: np.ndarray, radius: float) -> np.ndarray:
+    """Return the node of every point as the index of its first point. Revisited points are snapped to canonical
+    nodes within the radius in the order of the route like in create_node_pairs, other points are nodes of their
+    own."""
+    nodes = np.arange(len(north))
+    snapped = np.flatnonzero(revisited)
+    snapper = NodeSnapper(radius)
+    first_points: List[int] = []  # Indexed by node ids of the snapper
+    node_ids = []
+    for i, point_north, point_east in zip(snapped.tolist(), north[snapped].tolist(), east[snapped].tolist()):
+        node_id = snapper.snap(point_north, point_east)
+        if node_id == len(first_points):
+            first_points.append(i)
+        node_ids.append(node_id)
+    nodes[snapped] = np.array(first_points, dtype=np.int64)[np.array(node_ids, dtype=np.int64)]
+    return nodes
+
+
+def junction_nodes(visits: np.ndarray, size: int) -> np.ndarray:
+    """Return a mask of nodes where the route enters or leaves a street driven more than once. Such a node has more
+    than two distinct neighbors among all its visits, driving a street in both directions does not add any. Dead ends,
+    where the route turns back, have a single neighbor."""
+    edges = np.unique(np.sort(np.stack([visits[:-1], visits[1:]]), axis=0), axis=1)
+    degrees = np.bincount(edges.ravel(), minlength=size)
+    return (degrees == 1) | (degrees > 2)
+
+
+def collapse_stationary(north: np.ndarray, east: np.ndarray, tolerance: float) -> np.ndarray:
+    """Return the index of the point representing every point after collapsing stationary clusters. Consecutive
+    points in the same cell of a grid with the diagonal of the tolerance are a cluster represented by its first point.
+    Clusters split by cell borders are merged on grids shifted by half a cell."""
+    cell_size = tolerance / math.sqrt(2)
+    representatives = np.arange(len(north))
+    survivors = representatives
+    for shift_north, shift_east in ((0, 0), (0.5, 0), (0, 0.5), (0.5, 0.5)):
+        cells_north = np.floor(north[survivors] / cell_size + shift_north)
+        cells_east = np.floor(east[survivors] / cell_size + shift_east)
+        firsts = np.concatenate([[True], (np.diff(cells_north) != 0) | (np.diff(cells_east) != 0)])
+
+        merged = np.arange(len(north))
+        merged[survivors] = survivors[np.flatnonzero(firsts)][np.cumsum(firsts) - 1]
+        representatives = merged[representatives]
+        survivors = survivors[firsts]
+    return representatives
+
+
+def route_arc(north: np.ndarray, east: np.ndarray) -> np.ndarray:
+    # Distance of every point from the start along the route.
+    return np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(north), np.diff(east)))])
+
+
+def turn_points(north: np.ndarray, east: np.ndarray, arc: np.ndarray, tolerance: float) -> np.ndarray:
+    """Return a mask of points where the heading changes by more than TURN_ANGLE. Headings are measured over
+    a baseline along the route, so GPS noise of dense traces is not a turn."""
+    baseline = max(2 * tolerance, MIN_PAIR_LENGTH)
+    back = np.maximum(np.searchsorted(arc, arc - baseline, side="right") - 1, 0)
+    forward = np.minimum(np.searchsorted(arc, arc + baseline, side="left"), len(arc) - 1)
+
+    north_in, east_in = north - north[back], east - east[back]
+    north_out, east_out = north[forward] - north, east[forward] - east
+    norms = np.hypot(north_in, east_in) * np.hypot(north_out, east_out)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cosines = (north_in * north_out + east_in * east_out) / norms
+    return (norms > 0) & (cosines < math.cos(math.radians(TURN_ANGLE)))
+
+
+def revisited_points(north: np.ndarray, east: np.ndarray, arc: np.ndarray, radius: float) -> np.ndarray:
+    """Return a mask of points close to another pass of the route, on a street driven more than once or where the
+    route crosses it. Points are bucketed into cells of REVISIT_RADIUS snap radii. A point is close to another pass if
+    the cells around it hold a point much further or earlier along the route."""
+    cells = np.floor(np.stack([north, east]) / (REVISIT_RADIUS * radius)).astype(np.int64)
+    cells -= cells.min(axis=1, keepdims=True) - 1
+    width = int(cells[1].max()) + 2
+    keys = cells[0] * width + cells[1]
+
+    order = np.argsort(keys, kind="stable")
+    unique_keys, firsts = np.unique(keys[order], return_index=True)
+    min_arcs = np.minimum.reduceat(arc[order], firsts)
+    max_arcs = np.maximum.reduceat(arc[order], firsts)
+
+    nearby_min, nearby_max = arc.copy(), arc.copy()
+    for offset in (i * width + j for i in (-1, 0, 1) for j in (-1, 0, 1)):
+        positions = np.minimum(np.searchsorted(unique_keys, keys + offset), len(unique_keys) - 1)
+        found = unique_keys[positions] == keys + offset
+        nearby_min[found] = np.minimum(nearby_min[found], min_arcs[positions[found]])
+        nearby_max[found] = np.maximum(nearby_max[found], max_arcs[positions[found]])
+    arc_length = REVISIT_ARC_LENGTH * radius
+    return (arc - nearby_min > arc_length) | (nearby_max - arc > arc_length)
+
+
+def douglas_peucker(north: np.ndarray, east: np.ndarray, kept: np.ndarray, tolerance: float) -> np.ndarray:
+    """Extend the mask of kept points with Douglas-Peucker. Between consecutive kept points, the point farthest from
+    the chord is kept while it is farther than the tolerance. All chords of a level are split at once."""
+    kept = kept.copy()
+    indices = np.flatnonzero(kept)
+    starts, ends = indices[:-1], indices[1:]
+
+    while True:
+        inner_chords = ends - starts > 1
+        starts, ends = starts[inner_chords], ends[inner_chords]
+        if not len(starts):
+            return kept
+
+        # Interior points of all chords, grouped by chord.
+        lengths = ends - starts - 1
+        bounds = np.cumsum(lengths) - lengths
+        chords = np.repeat(np.arange(len(starts)), lengths)
+        inner = starts[chords] + 1 + np.arange(lengths.sum()) - bounds[chords]
+
+        distances = segment_distances(north[inner], east[inner], north[starts[chords]], east[starts[chords]],
+                                      north[ends[chords]], east[ends[chords]])
+        farthest = np.maximum.reduceat(distances, bounds)
+        candidates = np.flatnonzero(distances == farthest[chords])
+        splits = inner[candidates[np.unique(chords[candidates], return_index=True)[1]]]
+
+        split = farthest > tolerance
+        splits = splits[split]
+        kept[splits] = True
+        starts, ends = np.concatenate([starts[split], splits]), np.concatenate([splits, ends[split]])
+
+
+def segment_distances(north: np.ndarray, east: np.ndarray, north_from: np.ndarray, east_from: np.ndarray,
+                      north_to: np.ndarray, east_to: np.ndarray) -> np.ndarray:
+    # Distances of points to segments. Segments of zero length are points.
+    north_segment, east_segment = north_to - north_from, east_to - east_from
+    lengths = north_segment ** 2 + east_segment ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        positions = np.clip(((north - north_from) * north_segment + (east - east_from) * east_segment) / lengths, 0, 1)
+    positions[lengths == 0] = 0
+    return np.hypot(north - north_from - positions * north_segment, east - east_from - positions * east_segment)
@@ -1,10 +1,14 @@
 import math
 from abc import ABC
 from pprint import pformat
-from typing import List, Dict, Tuple
+from typing import List, Tuple, Optional, Union, Dict, Sequence
+
+import numpy as np
 
 from node import Node
-from node_pair import NodePair
+from node_pair import PairGraph
+
+BEARING_TOLERANCE = 1e-9  # Degrees. Turns closer to zero are computed with scalar math
 
 
 class RoutePart(ABC):
@@ -27,6 +31,22 @@ class Connection(RoutePart):
         super().__init__([node_from, node_to])
 
 
+class Lane:
+    """Lane is a segment of a pair with a flag showing whether the route already passes through it."""
+
+    __slots__ = ("segment", "used")
+
+    def __init__(self, segment: RoutePart):
+        self.segment = segment
+        self.used = False
+
+    def __str__(self):
+        return f"Lane(used: {self.used}, segment: {self.segment})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class Route:
     """Route class represents a final route consisting of RouteParts."""
 
@@ -40,69 +60,136 @@ class Route:
         return self.__str__()
 
 
-def create_route(segments: Dict[NodePair, List[Dict]], pairs_order: List[NodePair]) -> Route:
-    route_parts = []
-    last_lane = None
+def create_route(segments: Union[List[List[Lane]], Dict[int, List[Lane]]], graph: PairGraph,
+                 order: List[int] = None, free_lanes: "FreeLanes" = None) -> Route:
+    """Connect lanes of pairs in the order (graph.order by default). Segments are lanes of pairs indexed by pair id.
+    Routes sharing lanes can share free lanes of the segments too."""
+    route_parts: List[RoutePart] = []
+    connect_route(segments, graph, route_parts, [], order=order, free_lanes=free_lanes)
+    return Route(route_parts)
 
-    for i in range(len(pairs_order) - 1):
-        pair = pairs_order[i]
-        next_pair = pairs_order[i + 1]
-        segment = segments[pair]
-        next_segment = segments[next_pair]
 
-        # Calculate angle between current segment and next segment.
-        initial_bearing = calculate_bearing((pair.node_from.latlon.lat,
-                                             pair.node_from.latlon.lon),
-                                            (pair.node_to.latlon.lat,
-                                             pair.node_to.latlon.lon))
-        bearing = calculate_bearing((pair.node_to.latlon.lat, pair.node_to.latlon.lon),
-                                    (next_pair.node_from.latlon.lat, next_pair.node_from.latlon.lon)) - initial_bearing
+def connect_route(segments: Union[List[Sequence[Lane]], Dict[int, List[Lane]]], graph: PairGraph,
+                  route_parts: List[RoutePart], lanes: List[Lane], start: int = 0, order: List[int] = None,
+                  free_lanes: "FreeLanes" = None):
+    """Connect lanes of pairs from the position start of the order (graph.order by default) to the end of the route.
+    Lanes used at positions up to start have to be in lanes and their parts in route_parts already. The lane used at
+    every position is appended to lanes."""
+    order = graph.order if order is None else order
+    last_lane = lanes[start] if lanes else None
+    free_lanes = free_lanes if free_lanes is not None else FreeLanes(segments)
 
-        # Greedy connect to a more suitable lane.
-        if bearing < 0:
-            # Connect to the left most lane possible.
-            last_lane = connect_segments(last_lane, segment, next_segment, route_parts, side='left')
-
-        else:
-            # Connect to the right most lane possible.
-            last_lane = connect_segments(last_lane, segment, next_segment, route_parts, side='right')
+    for i, bearing in enumerate(turn_bearings(graph, start, order).tolist(), start):
+        # The route starts with the first lane of the first pair.
+        if last_lane is None:
+            last_lane = free_lanes.take(order[i], 'left')
+            lanes.append(last_lane)
 
-    # Corner case. Append the last segment.
-    route_parts.append(last_lane['segment'])
+        # Greedy connect to a more suitable lane.
+        # Connect to the left most lane possible if the route turns left, to the right most lane otherwise.
+        next_lane = free_lanes.take(order[i + 1], 'left' if bearing < 0 else 'right')
 
-    return Route(route_parts)
+        route_parts.append(last_lane.segment)
+        route_parts.append(Connection(last_lane.segment.nodes[-1],
+                                      next_lane.segment.nodes[0] if next_lane is not None else None))
+        last_lane = next_lane if next_lane is not None else last_lane
+        lanes.append(last_lane)
 
+    # A route of a single pair consists of its first lane.
+    if last_lane is None and order:
+        last_lane = free_lanes.take(order[0], 'left')
+        lanes.append(last_lane)
 
-def connect_segments(last_lane: Dict, segment: List[Dict], next_segment: List[Dict], route_parts: List[RoutePart],
-                     side: str) -> Dict:
-    node_to = None
-    if last_lane is None:
-        segment[0]['used'] = True
-        node_from = segment[0]['segment'].nodes[-1]
-        segment_to_append = segment[0]['segment']
-    else:
-        node_from = last_lane['segment'].nodes[-1]
-        segment_to_append = last_lane['segment']
-
-    if side == 'left':
-        for lane in next_segment:
-            if not lane['used']:
-                lane['used'] = True
-                last_lane = lane
-                node_to = lane['segment'].nodes[0]
-                break
-    else:
-        for lane in reversed(next_segment):
-            if not lane['used']:
-                lane['used'] = True
-                last_lane = lane
-                node_to = lane['segment'].nodes[0]
-                break
-
-    route_parts.append(segment_to_append)
-    route_parts.append(Connection(node_from, node_to))
-
-    return last_lane
+    # Corner case. Append the last segment.
+    if last_lane is not None:
+        route_parts.append(last_lane.segment)
+
+
+class FreeLanes:
+    """FreeLanes takes unused lanes of pairs in constant time. Lanes are taken only from the left or from the right
+    end of the unused lanes of a pair, so unused lanes always form a range. The range of a pair is found from used
+    flags of its lanes when the pair is met for the first time."""
+
+    def __init__(self, segments: Union[List[List[Lane]], Dict[int, List[Lane]]]):
+        self.segments = segments
+        # Ranges of unused lanes of the pairs met so far. Keyed by pair id.
+        self.lefts: Dict[int, int] = dict()
+        self.rights: Dict[int, int] = dict()
+
+    def take(self, pair_id: int, side: str) -> Optional[Lane]:
+        """Mark the left most (or the right most) unused lane of the pair as used and return it.
+        Return None if all lanes are used."""
+        lanes = self.segments[pair_id]
+        left, right = self.lefts.get(pair_id), self.rights.get(pair_id)
+        if left is None:
+            left, right = 0, len(lanes) - 1
+            while left <= right and lanes[left].used:
+                left += 1
+            while right >= left and lanes[right].used:
+                right -= 1
+
+        if left > right:
+            lane = None
+        elif side == 'left':
+            lane = lanes[left]
+            left += 1
+        else:
+            lane = lanes[right]
+            right -= 1
+
+        if lane is not None:
+            lane.used = True
+        self.lefts[pair_id], self.rights[pair_id] = left, right
+        return lane
+
+
+def turn_bearings(graph: PairGraph, start: int = 0, order: List[int] = None) -> np.ndarray:
+    """Return the angle between every pair and the next one in the order (graph.order by default) from the position
+    start, the same as calculate_bearing computes it. Bearings are computed for all positions at once."""
+    order = np.asarray((graph.order if order is None else order)[start:], dtype=np.int64)
+    if len(order) < 2:
+        return np.empty(0)
+
+    # Coordinates are gathered once per distinct pair of the order.
+    pair_ids, positions = np.unique(order, return_inverse=True)
+    pairs = [graph.pairs[pair_id] for pair_id in pair_ids.tolist()]
+    coordinates = np.array([(pair.node_from.latlon.lat, pair.node_from.latlon.lon,
+                             pair.node_to.latlon.lat, pair.node_to.latlon.lon) for pair in pairs])[positions]
+    lats_from, lons_from, lats_to, lons_to = coordinates[:-1].T
+    next_lats_from, next_lons_from = coordinates[1:, 0], coordinates[1:, 1]
+
+    initial_bearings = calculate_bearings(lats_from, lons_from, lats_to, lons_to)
+    turn_to_bearings = calculate_bearings(lats_to, lons_to, next_lats_from, next_lons_from)
+    bearings = turn_to_bearings - initial_bearings
+
+    # Vectorized trigonometry may differ from math in the last bits, which decides the turn side only if a bearing
+    # is close to zero or to the north, where it wraps around. Such turns are computed with calculate_bearing.
+    # Connected pairs share the node, the bearing between the same points is exactly zero with both.
+    def wraps(compass_bearings: np.ndarray) -> np.ndarray:
+        return np.minimum(compass_bearings, 360 - compass_bearings) < BEARING_TOLERANCE
+
+    same_points = (lats_to == next_lats_from) & (lons_to == next_lons_from)
+    uncertain = (np.abs(bearings) < BEARING_TOLERANCE) | wraps(initial_bearings) \
+        | (wraps(turn_to_bearings) & ~same_points)
+    for i in np.flatnonzero(uncertain).tolist():
+        bearings[i] = calculate_bearing((lats_to[i], lons_to[i]), (next_lats_from[i], next_lons_from[i])) \
+            - calculate_bearing((lats_from[i], lons_from[i]), (lats_to[i], lons_to[i]))
+
+    return bearings
+
+
+def calculate_bearings(lats_from: np.ndarray, lons_from: np.ndarray, lats_to: np.ndarray,
+                       lons_to: np.ndarray) -> np.ndarray:
+    # Vectorized calculate_bearing.
+    lat1 = np.radians(lats_from)
+    lat2 = np.radians(lats_to)
+
+    diff_long = np.radians(lons_to - lons_from)
+
+    x = np.sin(diff_long) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - (np.sin(lat1) * np.cos(lat2) * np.cos(diff_long))
+
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
 
 
 def calculate_bearing(a: Tuple[float, float], b: Tuple[float, float]) -> float:
@@ -1,141 +1,108 @@
-from typing import List, Dict
+from typing import List, Sequence, Optional, Union
 
-from shapely.geometry import LineString, Point
-from shapely.ops import nearest_points
+import numpy as np
 
-from config import LANE_OFFSET, INTERSECTION_OFFSET, MIN_PAIR_LENGTH, LANE_OFFSET_LENGTH_REDUCTION
-from node import Node, UTM, LatLon
-from node_pair import NodePair
-from route import RoutePart
+from geometry import offset_lanes
+from node import Node
+from node_pair import NodePair, PairGraph
+from options import SimplifyOptions
+from points import Points
+from route import RoutePart, Lane
+
+GEOMETRY_BACKENDS = ("numpy", "shapely")
 
 
 class Segment(RoutePart):
     """Segments are shortened and offsetted NodePairs."""
 
-    def __init__(self, pair: NodePair, offset_multiplier: int, pairs_dict: Dict[NodePair, int]):
+    def __init__(self, pair: NodePair, offset_multiplier: int, nodes: List[Node]):
+        self.pair = pair
+        self.offset_multiplier = offset_multiplier
+        super().__init__(nodes)
+
+
+class ArrayLanes:
+    """ArrayLanes are lanes of a pair indexed by offset multiplier like a list of lanes. Lanes of all pairs created at
+    once are rows of the same points: starts of all lanes followed by their ends. Lane, Segment and Node objects of a
+    pair are created when its lanes are accessed for the first time, so creating lanes costs only their arrays."""
+
+    __slots__ = ("pair", "multipliers", "points", "first", "ends", "lanes")
+
+    def __init__(self, pair: NodePair, multipliers: np.ndarray, points: Points, first: int, ends: int):
         self.pair = pair
-        super().__init__(
-            self.create_nodes([self.pair.node_from, self.pair.node_to], offset_multiplier, pairs_dict, LANE_OFFSET))
-
-    def create_nodes(self, nodes: List[Node], offset_multiplier: int, pairs_dict, offset_distance: float) -> List[Node]:
-        string = LineString([[node.utm.north, node.utm.east] for node in nodes])
-
-        # Shorten string to avoid overlaps with neighbor strings' offsets
-        string = self.shorten_linestring(string, pairs_dict, offset_distance, offset_multiplier)
-
-        # Offset string
-        zone_latlon = nodes[0].latlon
-        nodes = self.offset_linestring(zone_latlon, string, offset_distance, offset_multiplier)
-
-        return nodes
-
-    @staticmethod
-    def offset_linestring(zone_latlon: LatLon, string: LineString, offset_distance: float,
-                          offset_multiplier: int) -> List[Node]:
-        offsetted_string = string.parallel_offset((offset_multiplier + 1) * offset_distance, side='left', resolution=10)
-
-        nodes = []
-        if isinstance(offsetted_string, LineString):
-            for north, east in list(offsetted_string.coords):
-                utm = UTM(north, east)
-                nodes.append(Node(utm.convert_to_latlon(zone_latlon)))
-        else:
-            raise Exception(f"Error while offsetting linestring. The result geometry is not a LineString.")
-
-        return nodes
-
-    def shorten_linestring(self, string: LineString, pairs_dict: Dict[NodePair, int], offset_distance: float,
-                           offset_multiplier: int):
-        # Distance to cut from the back of the string.
-        if len(self.pair.comes_from) > 0:
-            cut_distance_back = max(
-                [self.find_cut_distance(string, pair, pairs_dict[pair], offset_distance, 'back') for pair in
-                 self.pair.comes_from])
-            cut_distance_back = cut_distance_back + INTERSECTION_OFFSET
-        else:
-            cut_distance_back = 0.0
-
-        # Shorten string in stairs style
-        cut_distance_back += LANE_OFFSET_LENGTH_REDUCTION * offset_multiplier
-        cut_distance_back = min(cut_distance_back, string.length - MIN_PAIR_LENGTH)
-
-        # Distance to cut from the front of the string.
-        if len(self.pair.leads_to) > 0:
-            cut_distance_front = max(
-                [self.find_cut_distance(string, pair, pairs_dict[pair], offset_distance, 'front') for pair in
-                 self.pair.leads_to])
-            cut_distance_front = cut_distance_front + INTERSECTION_OFFSET
-        else:
-            cut_distance_front = 0.0
-
-        # Shorten string in stairs style
-        cut_distance_front += LANE_OFFSET_LENGTH_REDUCTION * offset_multiplier
-        cut_distance_front = min(cut_distance_front, max(string.length - cut_distance_back - MIN_PAIR_LENGTH, 0))
-
-        shorter_string = self.cut_linestring(string, cut_distance_back, cut_distance_front)
-
-        return shorter_string
-
-    @staticmethod
-    def find_cut_distance(current_string: LineString, pair, frequency: int, offset_distance: float, side: str):
-        neighbor_string = LineString([[pair.node_from.utm.north, pair.node_from.utm.east],
-                                      [pair.node_to.utm.north, pair.node_to.utm.east]])
-        offsetted_neighbor_string = neighbor_string.parallel_offset(frequency * offset_distance, side='left',
-                                                                    resolution=10)
-
-        # Project neighbor string onto current string.
-        if side == 'back':
-            projected_point = Point(
-                nearest_points(current_string, Point(list(offsetted_neighbor_string.coords)[-1]))[0])
-        else:
-            projected_point = Point(nearest_points(current_string, Point(list(offsetted_neighbor_string.coords)[0]))[0])
-
-        # Create a line from the side of the current string to the projected points.
-        if side == 'back':
-            line = LineString([Point(list(current_string.coords)[0]), projected_point])
-        else:
-            line = LineString([Point(list(current_string.coords)[-1]), projected_point])
-
-        return line.length
-
-    def cut_linestring(self, string: LineString, first_cut_distance: float,
-                       second_cut_distance: float) -> LineString:
-        before, after = self.cut_linestring_by_distance(string, first_cut_distance)
-        before, after = self.cut_linestring_by_distance(after, after.length - second_cut_distance)
-
-        return before
-
-    @staticmethod
-    def cut_linestring_by_distance(string: LineString, distance: float):
-        if distance <= 0.0:
-            return None, string
-        elif distance >= string.length:
-            return string, None
-
-        coords = list(string.coords)
-        for i, p in enumerate(coords):
-            pd = string.project(Point(p))
-            if pd == distance:
-                return LineString(coords[:i + 1]), LineString(coords[i:])
-            if pd > distance:
-                cp = string.interpolate(distance)
-                return LineString(coords[:i] + [(cp.x, cp.y)]), LineString([(cp.x, cp.y)] + coords[i:])
-
-
-def create_segments(pairs_dict: Dict[NodePair, int]) -> Dict[NodePair, List[Dict]]:
-    segments: Dict[NodePair, List[Dict]] = dict()
-
-    for pair, frequency in pairs_dict.items():
-        for i in range(frequency):
-            if pair in segments:
-                segments[pair].append({
-                    "used": False,
-                    "segment": Segment(pair, i, pairs_dict)
-                })
-            else:
-                segments[pair] = [{
-                    "used": False,
-                    "segment": Segment(pair, i, pairs_dict)
-                }]
-
-    return segments
+        self.multipliers = multipliers  # Offset multipliers of the lanes
+        self.points = points
+        self.first = first  # Row of the start of the first lane
+        self.ends = ends  # Rows of ends follow rows of starts of all lanes
+        self.lanes: Optional[List[Lane]] = None
+
+    def __len__(self):
+        return len(self.multipliers) if self.lanes is None else len(self.lanes)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[Lane, List[Lane]]:
+        return self.create()[item]
+
+    def __iter__(self):
+        return iter(self.create())
+
+    def __str__(self):
+        return f"ArrayLanes(pair: {self.pair}, lanes: {len(self)})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def create(self) -> List[Lane]:
+        if self.lanes is None:
+            count = len(self.multipliers)
+            starts = self.points[self.first:self.first + count]
+            ends = self.points[self.ends + self.first:self.ends + self.first + count]
+            self.lanes = [Lane(Segment(self.pair, multiplier, [start, end]))
+                          for multiplier, start, end in zip(self.multipliers.tolist(), starts, ends)]
+            # Points are shared by lanes of all pairs and freed once all of them are created.
+            self.points = None
+        return self.lanes
+
+
+def create_segments(graph: PairGraph, backend: str = "numpy", pair_ids: Sequence[int] = None,
+                    options: SimplifyOptions = None, lane_multipliers: Sequence[Sequence[int]] = None
+                    ) -> List[Sequence[Lane]]:
+    """Return lanes of every pair indexed by pair id. If pair ids are given, only lanes of these pairs are created
+    and returned in the order of pair ids. If offset multipliers of lanes are given for every pair id, only these
+    lanes are created. Options default to the values of config.py. Lanes of the NumPy geometry are ArrayLanes."""
+    options = options if options is not None else SimplifyOptions()
+    if backend == "shapely":
+        # Shapely is an optional reference backend.
+        from shapely_segment import create_shapely_segments
+        return create_shapely_segments(graph, pair_ids, options, lane_multipliers)
+    elif backend != "numpy":
+        raise Exception(f"Unknown geometry backend {backend}. Available backends: {', '.join(GEOMETRY_BACKENDS)}")
+
+    # Shorten and offset all lanes at once. Lanes reuse cut distances computed for their pair.
+    misses = graph.cut_distances_misses
+    lane_pair_ids, multipliers, starts, ends = offset_lanes(graph, options, pair_ids, lane_multipliers)
+    graph.cut_distances_hits += len(lane_pair_ids) - (graph.cut_distances_misses - misses)
+
+    # Convert coordinates of all lanes in one call.
+    zone = graph.pairs[0].node_from.utm.zone if graph.pairs else None
+    points = Points.from_utm(np.concatenate([starts[:, 0], ends[:, 0]]), np.concatenate([starts[:, 1], ends[:, 1]]),
+                             zone)
+
+    return create_lanes(graph, range(len(graph)) if pair_ids is None else pair_ids, lane_pair_ids, multipliers, points)
+
+
+def create_lanes(graph: PairGraph, pair_ids: Sequence[int], lane_pair_ids: np.ndarray, multipliers: np.ndarray,
+                 points: Points) -> List[ArrayLanes]:
+    """Create lanes of the pairs from pair ids and offset multipliers of lanes. Lanes of a pair are consecutive,
+    points are starts of all lanes followed by their ends. Lanes are returned in the order of pair ids."""
+    lane_pair_ids = np.asarray(lane_pair_ids, dtype=np.int64)
+    firsts = np.flatnonzero(np.diff(lane_pair_ids, prepend=-1))
+    counts = np.diff(firsts, append=len(lane_pair_ids))
+    ranges = {pair_id: (first, count)
+              for pair_id, first, count in zip(lane_pair_ids[firsts].tolist(), firsts.tolist(), counts.tolist())}
+
+    lanes = []
+    for pair_id in pair_ids:
+        first, count = ranges.get(pair_id, (0, 0))
+        lanes.append(ArrayLanes(graph.pairs[pair_id], multipliers[first:first + count], points, first,
+                                len(lane_pair_ids)))
+    return lanes
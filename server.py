@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import bz2
+import json
+import multiprocessing
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Deque, Set
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+from io_handler import parse_route, encode_route
+from segment import GEOMETRY_BACKENDS
+from simplify import simplify
+
+BATCH_SIZE = 16  # Maximum number of requests simplified by a worker at once
+BATCH_BYTES = 256 * 1024  # Larger requests are simplified alone
+MAX_BODY_BYTES = 512 * 2 ** 20
+LATENCY_WINDOW = 10000  # Percentiles are computed over latencies of the last requests
+CONTENT_TYPES = {"json": "application/json", "osm": "application/xml"}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+
+def simplify_requests(requests: List[Tuple[bytes, str, str, bool, str]]) -> List[Tuple[bool, bytes]]:
+    """Simplify a batch of requests in a worker process. Returns a success flag and the encoded route (or the error
+    message) of every request. A failing request does not fail the batch."""
+    results = []
+    for data, input_format, output_format, pretty_print, geometry in requests:
+        try:
+            route = simplify(parse_route(data, input_format), geometry)
+            results.append((True, encode_route(route, output_format, pretty_print)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}".encode("utf-8")))
+    return results
+
+
+def warm_up(geometry: str, warm: multiprocessing.Queue):
+    # Initializer of every worker process: import everything a request needs, run the pipeline once and report
+    # the worker as warm.
+    simplify([(52.52, 13.40), (52.5203, 13.40), (52.5203, 13.4005)], geometry)
+    warm.put(os.getpid())
+
+
+class PendingRequest:
+    """PendingRequest is a simplification request waiting for a worker."""
+
+    __slots__ = ("data", "input_format", "output_format", "pretty_print", "geometry", "future")
+
+    def __init__(self, data: bytes, input_format: str, output_format: str, pretty_print: bool, geometry: str,
+                 future: asyncio.Future):
+        self.data = data
+        self.input_format = input_format
+        self.output_format = output_format
+        self.pretty_print = pretty_print
+        self.geometry = geometry
+        self.future = future
+
+
+class SimplifyServer:
+    """SimplifyServer is a local HTTP server simplifying routes in a pool of warm worker processes.
+
+    POST /simplify accepts a JSON or OSM route (optionally compressed with gzip or bzip2) and returns the simplified
+    route. Formats are chosen with ?input=json|osm and ?output=json|osm, the input format is guessed from the
+    Content-Type or the body otherwise. Small requests waiting for a worker are coalesced into batches.
+    GET /metrics returns counters, latency percentiles and the queue depth, GET /health returns the status."""
+
+    def __init__(self, workers: int = None, geometry: str = "numpy", batch_size: int = BATCH_SIZE,
+                 batch_delay: float = 0.0):
+        self.workers = workers or os.cpu_count()
+        self.geometry = geometry
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay  # Seconds a request waits for others to be batched with when a worker is free
+
+        self.pending: Deque[PendingRequest] = deque()
+        self.in_flight = 0  # Requests simplified by workers right now
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.counters: Dict[str, int] = {"requests": 0, "errors": 0, "batches": 0, "dispatched": 0}
+        self.started = time.time()
+
+        self.arrived = asyncio.Event()  # Set when a request is added to pending
+        self.free_workers = asyncio.Semaphore(self.workers)
+        self.executor = None
+        self.server = None
+        self.batcher = None
+        self.batches: Set[asyncio.Task] = set()  # Running batches, referenced until they are done
+        self.connections: Dict[asyncio.StreamWriter, asyncio.Task] = dict()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080, unix_path: str = "") -> asyncio.AbstractServer:
+        """Start the workers and wait until they are warm, then start listening on the port or the Unix socket."""
+        loop = asyncio.get_running_loop()
+        warm = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up,
+                                            initargs=(self.geometry, warm))
+        # As many tasks as workers start all worker processes, every worker reports once it is warm.
+        await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+        for _ in range(self.workers):
+            await loop.run_in_executor(None, warm.get)
+        warm.close()
+
+        self.batcher = asyncio.create_task(self.batch_requests())
+
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle_connection, unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        # Idle keep-alive connections are closed, their handlers see the end of the stream and finish.
+        for writer in self.connections:
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.executor.shutdown(cancel_futures=True)
+
+    async def batch_requests(self):
+        # A batch is sent when a worker is free. Requests arriving while all workers are busy wait in pending
+        # and are coalesced into the next batches.
+        while True:
+            await self.free_workers.acquire()
+            while not self.pending:
+                self.arrived.clear()
+                await self.arrived.wait()
+            if self.batch_delay and len(self.pending) < self.batch_size:
+                await asyncio.sleep(self.batch_delay)
+
+            batch = [self.pending.popleft()]
+            while self.pending and len(batch) < self.batch_size and len(batch[0].data) <= BATCH_BYTES \
+                    and len(self.pending[0].data) <= BATCH_BYTES:
+                batch.append(self.pending.popleft())
+            task = asyncio.create_task(self.run_batch(batch))
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+
+    async def run_batch(self, batch: List[PendingRequest]):
+        loop = asyncio.get_running_loop()
+        self.in_flight += len(batch)
+        self.counters["batches"] += 1
+        self.counters["dispatched"] += len(batch)
+        try:
+            results = await loop.run_in_executor(self.executor, simplify_requests, [
+                (request.data, request.input_format, request.output_format, request.pretty_print, request.geometry)
+                for request in batch])
+        except Exception as e:
+            # Workers died or the executor is shut down.
+            results = [(False, f"{type(e).__name__}: {e}".encode("utf-8"))] * len(batch)
+        finally:
+            self.in_flight -= len(batch)
+            self.free_workers.release()
+
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def metrics(self) -> Dict:
+        latencies = np.array(self.latencies) * 1000
+        percentiles = np.percentile(latencies, [50, 90, 99]).tolist() if len(latencies) else [0.0, 0.0, 0.0]
+        return {
+            **self.counters,
+            "queue_depth": len(self.pending),
+            "in_flight": self.in_flight,
+            "workers": self.workers,
+            "mean_batch_size":
+                self.counters["dispatched"] / self.counters["batches"] if self.counters["batches"] else 0.0,
+            "latency_ms": {
+                "p50": percentiles[0],
+                "p90": percentiles[1],
+                "p99": percentiles[2],
+                "max": float(latencies.max()) if len(latencies) else 0.0,
+                "window": len(latencies)
+            },
+            "uptime_seconds": time.time() - self.started
+        }
+
+    async def simplify(self, query: Dict[str, List[str]], headers: Dict[str, str],
+                       body: bytes) -> Tuple[int, str, bytes]:
+        start = time.perf_counter()
+        self.counters["requests"] += 1
+
+        input_format = query.get("input", [""])[0] or guess_format(headers.get("content-type", ""), body)
+        output_format = query.get("output", ["json"])[0]
+        geometry = query.get("geometry", [self.geometry])[0]
+        if input_format not in CONTENT_TYPES or output_format not in CONTENT_TYPES or geometry not in GEOMETRY_BACKENDS:
+            self.counters["errors"] += 1
+            return 400, "text/plain", f"Formats are {', '.join(CONTENT_TYPES)}, geometry backends are " \
+                                      f"{', '.join(GEOMETRY_BACKENDS)}".encode("utf-8")
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(PendingRequest(body, input_format, output_format,
+                                           query.get("pretty", ["1"])[0] not in ("0", "false"), geometry, future))
+        self.arrived.set()
+        succeeded, payload = await future
+
+        self.latencies.append(time.perf_counter() - start)
+        if not succeeded:
+            self.counters["errors"] += 1
+            return 422, "text/plain", payload
+        return 200, CONTENT_TYPES[output_format], payload
+
+    async def dispatch(self, method: str, target: str, headers: Dict[str, str],
+                       body: bytes) -> Tuple[int, str, bytes]:
+        url = urlsplit(target)
+        if url.path == "/simplify":
+            if method != "POST":
+                return 405, "text/plain", b"Use POST"
+            return await self.simplify(parse_qs(url.query), headers, body)
+        elif url.path in ("/metrics", "/health"):
+            if method != "GET":
+                return 405, "text/plain", b"Use GET"
+            content = self.metrics() if url.path == "/metrics" else {"status": "ok"}
+            return 200, "application/json", json.dumps(content).encode("utf-8")
+        return 404, "text/plain", b"Not found"
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # HTTP/1.1 with keep-alive. Requests of a connection are handled one after another.
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await respond(writer, 400, "text/plain", b"Malformed request", False)
+                    break
+                if length < 0:
+                    await respond(writer, 400, "text/plain", b"Negative Content-Length", False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await respond(writer, 413, "text/plain", b"Request body is too large", False)
+                    break
+
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, content_type, payload = await self.dispatch(method, target, headers, body)
+                except Exception as e:
+                    status, content_type, payload = 500, "text/plain", f"{type(e).__name__}: {e}".encode("utf-8")
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.connections[writer]
+            writer.close()
+
+
+def guess_format(content_type: str, body: bytes) -> str:
+    if "json" in content_type:
+        return "json"
+    if "xml" in content_type:
+        return "osm"
+    # Compressed bodies are OSM if the first character of the decompressed body is "<".
+    if body[:2] == b"\x1f\x8b" or body[:3] == b"BZh":
+        return "osm" if parse_head(body).lstrip().startswith(b"<") else "json"
+    return "osm" if body.lstrip().startswith(b"<") else "json"
+
+
+def parse_head(body: bytes) -> bytes:
+    if body[:2] == b"\x1f\x8b":
+        return zlib.decompressobj(wbits=31).decompress(body, 64)
+    return bz2.BZ2Decompressor().decompress(body, 64)
+
+
+async def respond(writer: asyncio.StreamWriter, status: int, content_type: str, payload: bytes, keep_alive: bool):
+    writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                 f"Content-Type: {content_type}\r\n"
+                 f"Content-Length: {len(payload)}\r\n"
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+    await writer.drain()
+
+
+async def serve(args: argparse.Namespace):
+    server = SimplifyServer(args.workers, args.geometry, args.batch_size, args.batch_delay / 1000)
+    listener = await server.start(args.host, args.port, args.unix)
+    address = args.unix or f"http://{args.host}:{listener.sockets[0].getsockname()[1]}"
+    print(f"Serving on {address} with {server.workers} warm workers")
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve route simplification over local HTTP.')
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='Host to listen on.')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+    parser.add_argument('--unix', type=str, default="", help='Listen on a Unix socket at the path instead.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes. All CPUs by default.')
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="numpy",
+                        help='Default geometry backend. A request can choose another one with ?geometry=.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Maximum number of small requests simplified by a worker at once.')
+    parser.add_argument('--batch-delay', type=float, default=0.0,
+                        help='Milliseconds a request waits for others to be batched with when a worker is free.')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,162 @@
+from typing import List, Tuple, Sequence
+
+import numpy as np
+from shapely.geometry import LineString, Point
+from shapely.ops import nearest_points
+
+from config import MIN_PAIR_LENGTH
+from coordinates import Zone
+from node import Node
+from node_pair import NodePair, PairGraph
+from options import SimplifyOptions
+from points import Points
+from route import Lane
+from segment import Segment
+
+
+class ShapelySegment(Segment):
+    """ShapelySegment is a Segment shortened and offsetted with Shapely. It is the reference implementation of the
+    closed-form geometry in the geometry module."""
+
+    def __init__(self, pair: NodePair, offset_multiplier: int, graph: PairGraph, options: SimplifyOptions):
+        self.pair = pair
+        self.options = options
+        self.shapely_calls = 0  # Number of Shapely geometry operations used to create the segment
+        super().__init__(
+            pair, offset_multiplier,
+            self.create_nodes([pair.node_from, pair.node_to], offset_multiplier, graph, options.lane_offset))
+
+    def create_nodes(self, nodes: List[Node], offset_multiplier: int, graph: PairGraph,
+                     offset_distance: float) -> List[Node]:
+        string = LineString([[node.utm.north, node.utm.east] for node in nodes])
+
+        # Shorten string to avoid overlaps with neighbor strings' offsets
+        string = self.shorten_linestring(string, graph, offset_distance, offset_multiplier)
+
+        # Offset string
+        zone = nodes[0].utm.zone
+        nodes = self.offset_linestring(zone, string, offset_distance, offset_multiplier)
+
+        return nodes
+
+    def offset_linestring(self, zone: Zone, string: LineString, offset_distance: float,
+                          offset_multiplier: int) -> List[Node]:
+        offsetted_string = string.parallel_offset((offset_multiplier + 1) * offset_distance, side='left', resolution=10)
+        self.shapely_calls += 1
+
+        if isinstance(offsetted_string, LineString):
+            coords = list(offsetted_string.coords)
+            nodes = list(Points.from_utm([north for north, east in coords], [east for north, east in coords], zone))
+        else:
+            raise Exception(f"Error while offsetting linestring. The result geometry is not a LineString.")
+
+        return nodes
+
+    def shorten_linestring(self, string: LineString, graph: PairGraph, offset_distance: float,
+                           offset_multiplier: int):
+        # Distances to cut from the back and from the front of the string do not depend on the lane.
+        cut_distance_back, cut_distance_front = self.find_cut_distances(string, graph, offset_distance)
+
+        # Shorten string in stairs style
+        cut_distance_back += self.options.lane_offset_length_reduction * offset_multiplier
+        cut_distance_back = min(cut_distance_back, string.length - MIN_PAIR_LENGTH)
+
+        # Shorten string in stairs style
+        cut_distance_front += self.options.lane_offset_length_reduction * offset_multiplier
+        cut_distance_front = min(cut_distance_front, max(string.length - cut_distance_back - MIN_PAIR_LENGTH, 0))
+
+        shorter_string = self.cut_linestring(string, cut_distance_back, cut_distance_front)
+
+        return shorter_string
+
+    def find_cut_distances(self, string: LineString, graph: PairGraph, offset_distance: float) -> Tuple[float, float]:
+        # Cut distances are computed once per pair and memoized on the graph.
+        backs, fronts = graph.cut_distances_of(self.options.cut_distances_key())
+        if not np.isnan(backs[self.pair.id]):
+            graph.cut_distances_hits += 1
+            return float(backs[self.pair.id]), float(fronts[self.pair.id])
+        graph.cut_distances_misses += 1
+
+        # Distance to cut from the back of the string.
+        if len(graph.comes_from[self.pair.id]) > 0:
+            cut_distance_back = max(
+                [self.find_cut_distance(string, graph.pairs[pair_id], graph.frequencies[pair_id], offset_distance,
+                                        'back') for pair_id in graph.comes_from[self.pair.id]])
+            cut_distance_back = cut_distance_back + self.options.intersection_offset
+        else:
+            cut_distance_back = 0.0
+
+        # Distance to cut from the front of the string.
+        if len(graph.leads_to[self.pair.id]) > 0:
+            cut_distance_front = max(
+                [self.find_cut_distance(string, graph.pairs[pair_id], graph.frequencies[pair_id], offset_distance,
+                                        'front') for pair_id in graph.leads_to[self.pair.id]])
+            cut_distance_front = cut_distance_front + self.options.intersection_offset
+        else:
+            cut_distance_front = 0.0
+
+        backs[self.pair.id], fronts[self.pair.id] = cut_distance_back, cut_distance_front
+        return cut_distance_back, cut_distance_front
+
+    def find_cut_distance(self, current_string: LineString, pair, frequency: int, offset_distance: float, side: str):
+        neighbor_string = LineString([[pair.node_from.utm.north, pair.node_from.utm.east],
+                                      [pair.node_to.utm.north, pair.node_to.utm.east]])
+        offsetted_neighbor_string = neighbor_string.parallel_offset(frequency * offset_distance, side='left',
+                                                                    resolution=10)
+
+        # Project neighbor string onto current string.
+        if side == 'back':
+            projected_point = Point(
+                nearest_points(current_string, Point(list(offsetted_neighbor_string.coords)[-1]))[0])
+        else:
+            projected_point = Point(nearest_points(current_string, Point(list(offsetted_neighbor_string.coords)[0]))[0])
+
+        self.shapely_calls += 2
+
+        # Create a line from the side of the current string to the projected points.
+        if side == 'back':
+            line = LineString([Point(list(current_string.coords)[0]), projected_point])
+        else:
+            line = LineString([Point(list(current_string.coords)[-1]), projected_point])
+
+        return line.length
+
+    def cut_linestring(self, string: LineString, first_cut_distance: float,
+                       second_cut_distance: float) -> LineString:
+        before, after = self.cut_linestring_by_distance(string, first_cut_distance)
+        before, after = self.cut_linestring_by_distance(after, after.length - second_cut_distance)
+
+        return before
+
+    def cut_linestring_by_distance(self, string: LineString, distance: float):
+        if distance <= 0.0:
+            return None, string
+        elif distance >= string.length:
+            return string, None
+
+        coords = list(string.coords)
+        for i, p in enumerate(coords):
+            pd = string.project(Point(p))
+            self.shapely_calls += 1
+            if pd == distance:
+                return LineString(coords[:i + 1]), LineString(coords[i:])
+            if pd > distance:
+                cp = string.interpolate(distance)
+                self.shapely_calls += 1
+                return LineString(coords[:i] + [(cp.x, cp.y)]), LineString([(cp.x, cp.y)] + coords[i:])
+
+
+def create_shapely_segments(graph: PairGraph, pair_ids: Sequence[int] = None, options: SimplifyOptions = None,
+                            lane_multipliers: Sequence[Sequence[int]] = None) -> List[List[Lane]]:
+    # Lanes of every pair (or of the given pairs). Indexed by pair id (or ordered by the given pair ids).
+    # Only lanes with the given offset multipliers of every pair are created, if they are given.
+    segments: List[List[Lane]] = []
+    options = options if options is not None else SimplifyOptions()
+
+    for i, pair_id in enumerate(range(len(graph)) if pair_ids is None else pair_ids):
+        pair = graph.pairs[pair_id]
+        multipliers = range(graph.frequencies[pair_id]) if lane_multipliers is None else lane_multipliers[i]
+        segments.append([Lane(ShapelySegment(pair, multiplier, graph, options)) for multiplier in multipliers])
+        graph.shapely_calls += sum(lane.segment.shapely_calls for lane in segments[-1])
+
+    return segments
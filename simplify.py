@@ -1,65 +1,175 @@
 import argparse
-from typing import List, Dict
+import json
+import sys
+from typing import List, Callable, Union, Sequence, Dict
 
-from io_handler import read_route_json, save_route_osm, save_route_json, read_route_osm
-from node import Node
-from node_pair import create_node_pairs, NodePair
-from route import create_route, Route
-from segment import create_segments
+from cache import RouteCache, route_key, create_cached_segments
+from chunked import simplify_chunked, MAX_LANES
+from io_handler import read_route, save_route, route_format
+from points import Points
+from reduction import reduce_points
+from node_pair import create_node_pairs, PairGraph
+from options import SimplifyOptions
+from route import create_route, Route, Lane
+from segment import create_segments, GEOMETRY_BACKENDS
+from stats import PipelineStats
+from tiles import create_tiled_segments, TILE_SIZE
 
 
-def simplify_route(path_from: str, path_to: str, from_json: bool, to_json: bool):
-    # Read route from file
-    print("Reading the input route...")
-    if from_json:
-        original_route: List[Node] = read_route_json(path_from)
-    else:
-        original_route: List[Node] = read_route_osm(path_from)
-    print("Route parsed")
-
-    # Split route into node pairs and count their frequencies. pairs_dict is a graph with pairs as its vertices.
-    print("Creating node pairs...")
-    pairs_dict, pairs_order = create_node_pairs(original_route)
-    print("Created route pairs")
-
-    # Segments are shortened and offsetted pairs. Returns a mapping of pairs to segments.
-    print("Creating segments...")
-    segments: Dict[NodePair, List[Dict]] = create_segments(pairs_dict)
-    print("Segments created")
-
-    # Create route by connecting segments with connections and putting them in the correct order using pairs_order.
-    print("Simplifying...")
-    simplified_route: Route = create_route(segments, pairs_order)
-    print("Simplification completed")
-
-    print("Saving route...")
-    if to_json:
-        save_route_json(simplified_route, path_to)
-    else:
-        save_route_osm(simplified_route, path_to)
-    print(f"Route saved as {path_to}")
-    print("Done.")
+def simplify(points: Union[Points, Sequence[Dict[str, float]], Sequence[Sequence[float]]], geometry: str = "numpy",
+             stats: PipelineStats = None, log: Callable[[str], None] = lambda message: None,
+             cache: RouteCache = None, workers: int = 1, tile_size: float = TILE_SIZE,
+             reduce_tolerance: float = 0.0, options: SimplifyOptions = None) -> Route:
+    """Simplify a route held in memory. Points are a sequence of {"lat": ..., "lon": ...} dicts, of (lat, lon) pairs
+    or Points. If stats are given, they record timings and allocations of every stage and counters of the pipeline.
+    If a cache is given, a route simplified before is returned from it and lanes of known pairs are reused.
+    With more than one worker, segments are created in spatial tiles of tile_size meters by a process pool.
+    With a reduce tolerance, points moving the route by less than the tolerance in meters are removed first.
+    Options replace offsets of config.py for this call."""
+    stats = stats if stats is not None else PipelineStats(trace_allocations=False)
+    points = Points.from_latlons(points)
+    stats.count("input_points", len(points))
+
+    if reduce_tolerance > 0:
+        log("Reducing points...")
+        with stats.stage("reduce_points"):
+            points, collapsed, reduced = reduce_points(points, reduce_tolerance)
+        stats.count("collapsed_points", collapsed)
+        stats.count("reduced_points", reduced)
+        log(f"Removed {collapsed} stationary and {reduced} redundant points, {len(points)} points left")
+
+    if cache is not None:
+        key = route_key(points, geometry, options)
+        with stats.stage("cache_lookup"):
+            cached_route = cache.get_route(key)
+        if cached_route is not None:
+            stats.count("route_cache_hits", 1)
+            stats.count("route_parts", len(cached_route.parts))
+            log("Simplified route found in the cache")
+            return cached_route
+        stats.count("route_cache_misses", 1)
+
+    # Split route into node pairs and count their frequencies. PairGraph is a graph with pairs as its vertices.
+    log("Creating node pairs...")
+    with stats.stage("create_node_pairs"):
+        graph: PairGraph = create_node_pairs(points)
+    stats.count("dropped_pairs", graph.dropped_pairs)
+    stats.count("route_pairs", len(graph.order))
+    stats.count("distinct_pairs", len(graph))
+    log("Created route pairs")
+
+    # Segments are shortened and offsetted pairs. Returns lanes of every pair indexed by pair id.
+    log("Creating segments...")
+    with stats.stage("create_segments"):
+        if cache is None and workers > 1:
+            if geometry != "numpy":
+                raise Exception("Segments can be created in tiles only with the numpy geometry backend")
+            segments: List[List[Lane]] = create_tiled_segments(graph, workers, tile_size, options)
+        elif cache is None:
+            segments: List[List[Lane]] = create_segments(graph, geometry, options=options)
+        else:
+            hits, misses = cache.hits["segments"], cache.misses["segments"]
+            segments: List[List[Lane]] = create_cached_segments(graph, geometry, cache, options)
+            stats.count("segment_cache_hits", cache.hits["segments"] - hits)
+            stats.count("segment_cache_misses", cache.misses["segments"] - misses)
+            log(f"Lanes of {cache.hits['segments'] - hits} of {len(graph)} pairs found in the cache")
+    stats.count("lanes", sum(graph.frequencies))
+    stats.count("cut_distances_hits", graph.cut_distances_hits)
+    stats.count("cut_distances_misses", graph.cut_distances_misses)
+    stats.count("shapely_calls", graph.shapely_calls)
+    log(f"Segments created (cut distances cache hits: {graph.cut_distances_hits}, "
+        f"misses: {graph.cut_distances_misses}, hit rate: {graph.cut_distances_hit_rate():.0%})")
+
+    # Create route by connecting segments with connections and putting them in the correct order using graph.order.
+    log("Simplifying...")
+    with stats.stage("create_route"):
+        simplified_route: Route = create_route(segments, graph)
+    stats.count("route_parts", len(simplified_route.parts))
+    log("Simplification completed")
+
+    if cache is not None:
+        with stats.stage("cache_store"):
+            cache.put_route(key, simplified_route)
+
+    return simplified_route
+
+
+def simplify_route(path_from: str, path_to: str, geometry: str = "numpy", pretty_print: bool = True,
+                   log: Callable[[str], None] = print, stats: PipelineStats = None, cache: RouteCache = None,
+                   workers: int = 1, tile_size: float = TILE_SIZE, reduce_tolerance: float = 0.0,
+                   options: SimplifyOptions = None) -> Route:
+    stats = stats if stats is not None else PipelineStats(trace_allocations=False)
+
+    # Read route from file. The format is defined by the extension.
+    log("Reading the input route...")
+    with stats.stage("read"):
+        original_route: Points = read_route(path_from)
+    log("Route parsed")
+
+    simplified_route = simplify(original_route, geometry, stats, log, cache, workers, tile_size, reduce_tolerance,
+                                options)
+
+    log("Saving route...")
+    with stats.stage("write"):
+        save_route(simplified_route, path_to, pretty_print)
+    log(f"Route saved as {path_to}")
+    log("Done.")
+
+    return simplified_route
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Simplify route by offsetting overlapping lanes.')
     parser.add_argument('input_path', type=str, help='Path to the input file.')
     parser.add_argument('output_path', type=str, help='Path to the output file.')
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="numpy",
+                        help='Geometry backend for shortening and offsetting segments. Shapely is a slower reference.')
+    parser.add_argument('--no-pretty-print', action='store_true', help='Write OSM output without indentation.')
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default=None,
+                        help='Save timings, peak allocations and counters of every stage as JSON to the path, '
+                             'or print them if no path is given.')
+    parser.add_argument('--cache', type=str, default="",
+                        help='Path to a SQLite cache of simplified routes and lanes. It is created if missing.')
+    parser.add_argument('--cache-size', type=float, default=1024, help='Maximum size of the cache in megabytes.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Create segments of spatial tiles in a pool of worker processes. Used without a cache.')
+    parser.add_argument('--tile-size', type=float, default=TILE_SIZE, help='Size of spatial tiles in meters.')
+    parser.add_argument('--reduce', type=float, default=0.0,
+                        help='Remove stationary and redundant points moving the route by less than the tolerance in '
+                             'meters before simplifying. Turns and streets driven more than once are kept.')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='Simplify a route larger than memory in two passes over chunks of this many points, '
+                             'writing the result while it is created. Input is .json or .rsb, output .json or .osm.')
+    parser.add_argument('--max-lanes', type=int, default=MAX_LANES,
+                        help='Lanes kept in memory in chunked mode. Lanes of other pairs are created again.')
 
     args = parser.parse_args()
 
-    if args.output_path[-4:].lower() == ".osm":
-        to_json = False
-    elif args.output_path[-5:].lower() == ".json":
-        to_json = True
-    else:
-        raise Exception("Output file extension should be either .json or .osm")
+    # Check extensions before doing any work. Text input can be compressed with gzip or bzip2.
+    route_format(args.output_path)
+    route_format(args.input_path, compressed=True)
+
+    if args.chunk_size > 0 and (args.cache or args.workers > 1 or args.reduce > 0):
+        raise Exception("Chunked mode can not be used with a cache, workers or reduction")
+
+    # Statistics printed to stdout stay valid JSON, the progress goes to stderr then.
+    log = (lambda message: print(message, file=sys.stderr)) if args.profile == '-' else print
 
-    if args.input_path[-4:].lower() == ".osm":
-        from_json = False
-    elif args.input_path[-5:].lower() == ".json":
-        from_json = True
+    stats = PipelineStats(trace_allocations=args.profile is not None)
+    cache = RouteCache(args.cache, int(args.cache_size * 2 ** 20)) if args.cache else None
+    if args.chunk_size > 0:
+        simplify_chunked(args.input_path, args.output_path, geometry=args.geometry, chunk_size=args.chunk_size,
+                         max_lanes=args.max_lanes, pretty_print=not args.no_pretty_print, stats=stats, log=log)
     else:
-        raise Exception("Input file extension should be either .json or .osm")
+        simplify_route(args.input_path, args.output_path, geometry=args.geometry,
+                       pretty_print=not args.no_pretty_print, log=log, stats=stats, cache=cache,
+                       workers=args.workers, tile_size=args.tile_size, reduce_tolerance=args.reduce)
+    if cache is not None:
+        cache.close()
 
-    simplify_route(args.input_path, args.output_path, to_json=to_json, from_json=from_json)
+    if args.profile == '-':
+        json.dump(stats.to_dict(), sys.stdout, indent=2)
+        print()
+    elif args.profile:
+        with open(args.profile, "w") as f:
+            json.dump(stats.to_dict(), f, indent=2)
@@ -0,0 +1,45 @@
+import math
+from typing import List, Dict, Tuple
+
+from config import NODES_POSITION_ERROR
+
+
+class NodeSnapper:
+    """NodeSnapper merges nodes closer to each other than NODES_POSITION_ERROR into canonical nodes.
+
+    Canonical nodes are bucketed into a grid of UTM cells with the size of the tolerance, so a node
+    can only be merged with canonical nodes from its own cell or from the 8 cells around it."""
+
+    def __init__(self, tolerance: float = NODES_POSITION_ERROR):
+        self.tolerance = tolerance
+        # UTM coordinates of canonical nodes. Index of a node is its id.
+        self.norths: List[float] = []
+        self.easts: List[float] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = dict()
+
+    def __len__(self):
+        return len(self.norths)
+
+    def cell(self, north: float, east: float) -> Tuple[int, int]:
+        return math.floor(north / self.tolerance), math.floor(east / self.tolerance)
+
+    def snap(self, north: float, east: float) -> int:
+        """Return id of the canonical node for the UTM coordinates. Register the coordinates as a new canonical
+        node if there is no canonical node closer than the tolerance."""
+        cell_north, cell_east = self.cell(north, east)
+
+        # Prefer the earliest canonical node, the same way the pairwise comparison did.
+        snapped_id = None
+        for cell in ((cell_north + i, cell_east + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            for node_id in self.cells.get(cell, ()):
+                if (snapped_id is None or node_id < snapped_id) and math.sqrt(
+                        (north - self.norths[node_id]) ** 2 + (east - self.easts[node_id]) ** 2) < self.tolerance:
+                    snapped_id = node_id
+
+        if snapped_id is None:
+            snapped_id = len(self.norths)
+            self.norths.append(north)
+            self.easts.append(east)
+            self.cells.setdefault((cell_north, cell_east), []).append(snapped_id)
+
+        return snapped_id
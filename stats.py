@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Callable, Iterator
+
+
+class PipelineStats:
+    """PipelineStats records wall time and peak allocations of every pipeline stage and counters of the pipeline.
+    An optional observer is called with the name and the record of every finished stage.
+    Tracing allocations with tracemalloc slows the pipeline down, so it can be turned off."""
+
+    def __init__(self, trace_allocations: bool = True, observer: Callable[[str, Dict], None] = None):
+        self.trace_allocations = trace_allocations
+        self.observer = observer
+        self.stages: Dict[str, Dict[str, float]] = dict()
+        self.counters: Dict[str, int] = dict()
+
+    def __str__(self):
+        return f"PipelineStats(stages: {self.stages}, counters: {self.counters})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        # Do not stop tracing started by someone else.
+        started_tracing = self.trace_allocations and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            allocated_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            record = {"seconds": time.perf_counter() - start}
+            if self.trace_allocations:
+                record["peak_allocated_bytes"] = tracemalloc.get_traced_memory()[1] - allocated_before
+            if started_tracing:
+                tracemalloc.stop()
+
+            self.stages[name] = record
+            if self.observer is not None:
+                self.observer(name, record)
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict:
+        return {"stages": self.stages, "counters": self.counters}
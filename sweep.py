@@ -0,0 +1,106 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+from typing import List, Callable, Union, Sequence, Dict, Iterator, Tuple
+
+from config import LANE_OFFSET, LANE_OFFSET_LENGTH_REDUCTION, INTERSECTION_OFFSET
+from io_handler import read_route, save_route, route_format, strip_compression_extension, EXTENSIONS
+from node_pair import create_node_pairs, PairGraph
+from options import SimplifyOptions
+from points import Points
+from route import Route, create_route
+from segment import create_segments, GEOMETRY_BACKENDS
+from stats import PipelineStats
+
+
+def sweep_options(lane_offsets: Sequence[float] = (LANE_OFFSET,),
+                  lane_offset_length_reductions: Sequence[float] = (LANE_OFFSET_LENGTH_REDUCTION,),
+                  intersection_offsets: Sequence[float] = (INTERSECTION_OFFSET,)) -> List[SimplifyOptions]:
+    # Every combination of the values.
+    return [SimplifyOptions(*values)
+            for values in itertools.product(lane_offsets, lane_offset_length_reductions, intersection_offsets)]
+
+
+def simplify_sweep(points: Union[Points, Sequence[Dict[str, float]], Sequence[Sequence[float]]],
+                   options: Sequence[SimplifyOptions], geometry: str = "numpy", stats: PipelineStats = None,
+                   log: Callable[[str], None] = lambda message: None) -> Iterator[Tuple[SimplifyOptions, Route]]:
+    """Simplify a route with every options. Points are snapped and the pair graph is built once, only segments are
+    shortened and offsetted and lanes are connected again for every options. Options with the same lane offset and
+    intersection offset share cut distances. Routes are yielded one by one, so a single route is held at a time."""
+    stats = stats if stats is not None else PipelineStats(trace_allocations=False)
+    points = Points.from_latlons(points)
+    stats.count("input_points", len(points))
+    stats.count("options", len(options))
+
+    log("Creating node pairs...")
+    with stats.stage("create_node_pairs"):
+        graph: PairGraph = create_node_pairs(points)
+    stats.count("route_pairs", len(graph.order))
+    stats.count("distinct_pairs", len(graph))
+    log(f"Created {len(graph)} distinct pairs")
+
+    for i, option in enumerate(options):
+        log(f"Simplifying with {option}...")
+        with stats.stage(f"create_segments[{i}]"):
+            segments = create_segments(graph, geometry, options=option)
+        with stats.stage(f"create_route[{i}]"):
+            simplified_route = create_route(segments, graph)
+        yield option, simplified_route
+
+    stats.count("cut_distances_hits", graph.cut_distances_hits)
+    stats.count("cut_distances_misses", graph.cut_distances_misses)
+
+
+def output_path_for_options(input_path: str, output_dir: str, options: SimplifyOptions, output_extension: str) -> str:
+    # Values of the options are a part of the name, e.g. route.lane2_reduction0.5_intersection3.json.
+    stem = os.path.basename(strip_compression_extension(input_path))
+    stem = stem[:-len(os.path.splitext(stem)[1])]
+    return os.path.join(output_dir, f"{stem}.lane{options.lane_offset:g}_reduction"
+                                    f"{options.lane_offset_length_reduction:g}_intersection"
+                                    f"{options.intersection_offset:g}{output_extension}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simplify a route with every combination of offset settings.')
+    parser.add_argument('input_path', type=str, help='Path to the input file.')
+    parser.add_argument('output_dir', type=str, help='Directory for a result of every combination.')
+    parser.add_argument('--lane-offset', type=float, nargs='+', default=[LANE_OFFSET],
+                        help='Distances to which each lane is moved.')
+    parser.add_argument('--lane-offset-length-reduction', type=float, nargs='+',
+                        default=[LANE_OFFSET_LENGTH_REDUCTION], help='Length reductions of each offsetted lane.')
+    parser.add_argument('--intersection-offset', type=float, nargs='+', default=[INTERSECTION_OFFSET],
+                        help='Lengths by which segments next to intersections are shortened.')
+    parser.add_argument('--format', choices=list(EXTENSIONS), default=".json", help='Extension of the results.')
+    parser.add_argument('--geometry', choices=GEOMETRY_BACKENDS, default="numpy",
+                        help='Geometry backend for shortening and offsetting segments.')
+    parser.add_argument('--no-pretty-print', action='store_true', help='Write OSM output without indentation.')
+    parser.add_argument('--profile', type=str, nargs='?', const='-', default=None,
+                        help='Save timings and counters of every stage as JSON to the path, or print them if no path '
+                             'is given.')
+
+    args = parser.parse_args()
+
+    route_format(args.input_path, compressed=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Statistics printed to stdout stay valid JSON, the progress goes to stderr then.
+    log = (lambda message: print(message, file=sys.stderr)) if args.profile == '-' else print
+
+    stats = PipelineStats(trace_allocations=False)
+    log("Reading the input route...")
+    original_route = read_route(args.input_path)
+    all_options = sweep_options(args.lane_offset, args.lane_offset_length_reduction, args.intersection_offset)
+    for options, simplified_route in simplify_sweep(original_route, all_options, args.geometry, stats, log):
+        path_to = output_path_for_options(args.input_path, args.output_dir, options, args.format)
+        save_route(simplified_route, path_to, not args.no_pretty_print)
+        log(f"Route saved as {path_to}")
+    log("Done.")
+
+    if args.profile == '-':
+        json.dump(stats.to_dict(), sys.stdout, indent=2)
+        print()
+    elif args.profile:
+        with open(args.profile, "w") as f:
+            json.dump(stats.to_dict(), f, indent=2)
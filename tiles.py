@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Dict, Sequence
+
+import numpy as np
+
+from coordinates import Zone, utm_to_latlon
+from geometry import pair_vectors, offset_lanes
+from node import Node, UTM
+from node_pair import NodePair, PairGraph
+from options import SimplifyOptions
+from points import Points
+from route import Lane
+from segment import create_lanes
+
+TILE_SIZE = 2000  # meters. Pairs are assigned to square tiles of UTM coordinates by their midpoints
+
+
+def partition_pairs(graph: PairGraph, tile_size: float = TILE_SIZE) -> List[np.ndarray]:
+    """Split pair ids of the graph into spatial tiles. Tiles are ordered by their cells, pair ids within a tile
+    are sorted."""
+    if not len(graph):
+        return []
+    starts, ends, _, _, _ = pair_vectors(graph)
+    cells = np.floor((starts + ends) / 2 / tile_size).astype(np.int64)
+    _, tiles = np.unique(cells, axis=0, return_inverse=True)
+    tiles = tiles.reshape(-1)
+
+    pair_ids = np.argsort(tiles, kind="stable")
+    bounds = np.flatnonzero(np.diff(tiles[pair_ids])) + 1
+    return np.split(pair_ids, bounds)
+
+
+def tile_context(graph: PairGraph, pair_ids: np.ndarray, options: SimplifyOptions) -> Dict:
+    """Collect everything needed to create lanes of the pairs of a tile. Neighbors of the pairs from other tiles are
+    a read-only halo: their coordinates and frequencies define cut distances at the seams of the tile."""
+    tile = set(pair_ids.tolist())
+    halo = sorted({neighbor_id for pair_id in tile for neighbors in (graph.comes_from[pair_id], graph.leads_to[pair_id])
+                   for neighbor_id in neighbors} - tile)
+    ids = pair_ids.tolist() + halo
+    local_ids = {pair_id: i for i, pair_id in enumerate(ids)}
+
+    zone = graph.pairs[ids[0]].node_from.utm.zone
+    return {
+        "pair_ids": pair_ids,
+        "coordinates": np.array([(graph.pairs[pair_id].node_from.utm.north, graph.pairs[pair_id].node_from.utm.east,
+                                  graph.pairs[pair_id].node_to.utm.north, graph.pairs[pair_id].node_to.utm.east)
+                                 for pair_id in ids]),
+        "frequencies": [graph.frequencies[pair_id] for pair_id in ids],
+        # Links of the pairs of the tile in local ids. Links of halo pairs are not needed.
+        "comes_from": [[local_ids[neighbor_id] for neighbor_id in graph.comes_from[pair_id]] for pair_id in pair_ids],
+        "leads_to": [[local_ids[neighbor_id] for neighbor_id in graph.leads_to[pair_id]] for pair_id in pair_ids],
+        "zone": (zone.number, zone.northern),
+        "options": options
+    }
+
+
+def tile_lanes(context: Dict) -> int:
+    """Shorten and offset lanes of the pairs of a tile. Runs in a worker process. Latitudes, longitudes, norths and
+    easts of starts and ends of the lanes are written to their rows of the shared columns of all lanes, nothing large
+    is sent back. Returns the number of lanes."""
+    zone = Zone(*context["zone"])
+
+    # A graph of the tile with the halo. Local ids of the pairs of the tile come first.
+    graph = PairGraph()
+    for north_from, east_from, north_to, east_to in context["coordinates"].tolist():
+        graph.add_pair(NodePair(Node(None, UTM(north_from, east_from, zone)), Node(None, UTM(north_to, east_to, zone))))
+    graph.frequencies = context["frequencies"]
+    for i, (comes_from, leads_to) in enumerate(zip(context["comes_from"], context["leads_to"])):
+        graph.comes_from[i].update(comes_from)
+        graph.leads_to[i].update(leads_to)
+
+    _, _, starts, ends = offset_lanes(graph, context["options"], np.arange(len(context["pair_ids"])))
+    norths = np.concatenate([starts[:, 0], ends[:, 0]])
+    easts = np.concatenate([starts[:, 1], ends[:, 1]])
+    lats, lons = utm_to_latlon(norths, easts, zone)
+
+    # Starts of the lanes of the tile go to rows from the offset, their ends follow starts of all lanes.
+    count, offset, lanes = len(starts), context["offset"], context["lanes"]
+    shared = shared_memory.SharedMemory(name=context["shared"])
+    try:
+        columns = np.ndarray((4, 2 * lanes), dtype=np.float64, buffer=shared.buf)
+        for column, values in zip(columns, (lats, lons, norths, easts)):
+            column[offset:offset + count] = values[:count]
+            column[lanes + offset:lanes + offset + count] = values[count:]
+        del columns
+    finally:
+        shared.close()
+    return count
+
+
+def create_tiled_segments(graph: PairGraph, workers: int = None, tile_size: float = TILE_SIZE,
+                          options: SimplifyOptions = None) -> List[Sequence[Lane]]:
+    """Return lanes of every pair indexed by pair id like create_segments with the NumPy geometry. Tiles of pairs are
+    shortened and offsetted in a process pool straight into shared columns of all lanes. The main process only
+    creates ArrayLanes of pairs over the columns, so the work on lanes runs in the workers. The result is the same as
+    of create_segments."""
+    workers = workers or os.cpu_count()
+    options = options if options is not None else SimplifyOptions()
+    tiles = partition_pairs(graph, tile_size)
+    if not tiles:
+        return []
+
+    # Lanes of the tiles are consecutive, in the order of the tiles. The number of lanes of a pair is its frequency.
+    frequencies = np.asarray(graph.frequencies, dtype=np.int64)
+    pair_ids = np.concatenate(tiles)
+    counts = [int(frequencies[tile].sum()) for tile in tiles]
+    offsets = np.cumsum([0] + counts[:-1]).tolist()
+    lanes = sum(counts)
+
+    shared = shared_memory.SharedMemory(create=True, size=4 * 2 * lanes * 8)
+    try:
+        contexts = [{**tile_context(graph, tile, options), "shared": shared.name, "offset": offset, "lanes": lanes}
+                    for tile, offset in zip(tiles, offsets)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            written = list(executor.map(tile_lanes, contexts, chunksize=max(len(contexts) // (4 * workers), 1)))
+        if written != counts:
+            raise Exception(f"Tiles wrote {sum(written)} of {lanes} lanes")
+        columns = np.ndarray((4, 2 * lanes), dtype=np.float64, buffer=shared.buf).copy()
+    finally:
+        shared.close()
+        shared.unlink()
+
+    # Pair ids and offset multipliers of lanes in the same order as offset_lanes orders them within every tile.
+    lane_counts = frequencies[pair_ids]
+    lane_pair_ids = np.repeat(pair_ids, lane_counts)
+    multipliers = np.arange(lanes) - np.repeat(np.cumsum(lane_counts) - lane_counts, lane_counts)
+    points = Points(columns[0], columns[1], columns[2], columns[3], graph.pairs[0].node_from.utm.zone)
+    graph.cut_distances_misses += len(graph)
+    graph.cut_distances_hits += lanes - len(graph)
+
+    return create_lanes(graph, range(len(graph)), lane_pair_ids, multipliers, points)